@@ -1,16 +1,14 @@
 from flask import Flask
 from config import Config
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
-import googlemaps
-import os
 
-db = SQLAlchemy()
+from app.database import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 migrate = Migrate()
 login = LoginManager()
 login.login_view = 'main_bp.login'
-gmaps = googlemaps.Client(key=os.environ.get("GOOGLE_MAPS_API_KEY", default='AIza_KEY_HERE'))
 
 
 def create_app(config_class=Config):
@@ -21,8 +19,62 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     login.init_app(app)
 
+    from app.instrumentation import sql_instrumentation
+
+    sql_instrumentation.init_app(app)
+
+    from app.metrics import metrics
+
+    metrics.init_app(app)
+
+    from app.places import places
+
+    places.init_app(app)
+
+    from app.fragments import masterclass_cards
+
+    masterclass_cards.init_app(app)
+
+    from app.users import user_cache
+
+    user_cache.init_app(app)
+
+    from app.calendars import calendar_feeds
+
+    calendar_feeds.init_app(app)
+
+    from app.mail import mailer
+    from app.jobs import job_queue
+    from app import notifications  # noqa: F401 registers the email job handlers
+
+    mailer.init_app(app)
+    job_queue.init_app(app)
+
+    from app.sessions import SESSION_STORES, ServerSideSessionInterface
+
+    app.session_interface = ServerSideSessionInterface(
+        SESSION_STORES[app.config["SESSION_BACKEND"]](),
+        sweep_interval=app.config["SESSION_SWEEP_INTERVAL"],
+    )
+
     from app.routes import main_bp
+    from app.api import api_bp
 
     app.register_blueprint(main_bp)
+    app.register_blueprint(api_bp)
+
+    from app.commands import (
+        import_data,
+        promote_waitlists,
+        reconcile_booked_counts,
+        run_worker,
+        sweep_sessions,
+    )
+
+    app.cli.add_command(import_data)
+    app.cli.add_command(promote_waitlists)
+    app.cli.add_command(reconcile_booked_counts)
+    app.cli.add_command(run_worker)
+    app.cli.add_command(sweep_sessions)
 
     return app
@@ -0,0 +1,119 @@
+from datetime import datetime
+import json
+
+from flask import Blueprint, Response, abort, request, stream_with_context
+from flask_login import login_required
+
+from app.database import reads_from_replica
+from app.models import Location, Masterclass, MasterclassContent, db
+
+api_bp = Blueprint("api_bp", __name__, url_prefix="/api")
+
+# Fields each endpoint can return, and the columns they come from. Remote
+# joining details are left out as they're only for attendees.
+MASTERCLASS_FIELDS = {
+    "id": Masterclass.id,
+    "name": MasterclassContent.name,
+    "description": MasterclassContent.description,
+    "category": MasterclassContent.category,
+    "timestamp": Masterclass.timestamp,
+    "is_remote": Masterclass.is_remote,
+    "max_attendees": Masterclass.max_attendees,
+    "booked_count": Masterclass.booked_count,
+    "location_id": Masterclass.location_id,
+    "instructor_id": Masterclass.instructor_id,
+    "updated_at": Masterclass.updated_at,
+}
+
+LOCATION_FIELDS = {
+    "id": Location.id,
+    "name": Location.name,
+    "address": Location.address,
+    "building": Location.building,
+    "street_number": Location.street_number,
+    "street_name": Location.street_name,
+    "town_or_city": Location.town_or_city,
+    "postcode": Location.postcode,
+    "maps_id": Location.maps_id,
+}
+
+BATCH_SIZE = 1000
+
+
+@api_bp.route("/masterclasses", methods=["GET"])
+@login_required
+@reads_from_replica
+def masterclasses():
+    query = (
+        db.session.query(Masterclass)
+        .filter_by(draft=False)
+        .outerjoin(MasterclassContent, Masterclass.content)
+    )
+    return _stream(query, Masterclass.id, MASTERCLASS_FIELDS)
+
+
+@api_bp.route("/locations", methods=["GET"])
+@login_required
+@reads_from_replica
+def locations():
+    return _stream(db.session.query(Location), Location.id, LOCATION_FIELDS)
+
+
+def _stream(query, id_column, available_fields: dict) -> Response:
+    """
+    Streams the rows of a query as newline-delimited JSON, in id order.
+
+    Query string arguments:
+    - fields: comma separated fields to return, defaulting to all of them
+    - after: only return rows with an id greater than this. To page through
+      results pass the id of the last row of the previous page.
+    - limit: the most rows to return, defaulting to all of them
+
+    Rows are read from a server-side cursor in batches, so exporting the whole
+    table doesn't load it into memory.
+    """
+    fields = request.args.get("fields", ",".join(available_fields)).split(",")
+    if not fields or any(field not in available_fields for field in fields):
+        abort(400)
+    after = _int_arg("after")
+    limit = _int_arg("limit", minimum=0)
+
+    if after is not None:
+        query = query.filter(id_column > after)
+    query = (
+        query.with_entities(*[available_fields[field] for field in fields])
+        .order_by(id_column)
+        .limit(limit)
+        .execution_options(stream_results=True)
+        .yield_per(BATCH_SIZE)
+    )
+
+    def generate():
+        for row in query:
+            yield json.dumps(dict(zip(fields, row)), default=_to_json) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def _int_arg(name: str, minimum: int = None):
+    """
+    Returns an integer query string argument, or None if it isn't given.
+    Aborts with a 400 if it isn't an integer or is below minimum, rather
+    than ignoring it and returning every row.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        abort(400)
+    if minimum is not None and number < minimum:
+        abort(400)
+    return number
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
@@ -0,0 +1,256 @@
+from enum import Enum
+
+from sqlalchemy import and_, exists, func, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Masterclass, MasterclassAttendee, WaitlistEntry
+from app.notifications import queue_booking_confirmations
+
+
+class BookingOutcome(Enum):
+    BOOKED = "booked"
+    ALREADY_BOOKED = "already booked"
+    FULL = "full"
+    WAITLISTED = "waitlisted"
+    ALREADY_WAITLISTED = "already waitlisted"
+    CANCELLED = "cancelled"
+    NOT_BOOKED = "not booked"
+
+
+def reserve_seat(masterclass_id: int, attendee_id: int, session=None) -> BookingOutcome:
+    """
+    Books a user onto a masterclass if it has a place left.
+
+    The place is claimed with a single conditional UPDATE of booked_count, so
+    concurrent signups can't both take the last one, and the unique
+    constraint on attendee_id and masterclass_id stops the same user booking
+    twice. If the booking can't be made nothing is written. A successful
+    booking takes the user off the masterclass's waitlist.
+    """
+    session = session or db.session
+    already_booked = session.query(
+        session.query(MasterclassAttendee)
+        .filter_by(masterclass_id=masterclass_id, attendee_id=attendee_id)
+        .exists()
+    ).scalar()
+    if already_booked:
+        return BookingOutcome.ALREADY_BOOKED
+
+    claimed = (
+        session.query(Masterclass)
+        .filter(
+            Masterclass.id == masterclass_id,
+            Masterclass.booked_count < Masterclass.max_attendees,
+        )
+        .update(
+            {Masterclass.booked_count: Masterclass.booked_count + 1},
+            synchronize_session=False,
+        )
+    )
+    if not claimed:
+        session.commit()
+        return BookingOutcome.FULL
+
+    session.query(WaitlistEntry).filter_by(
+        masterclass_id=masterclass_id, attendee_id=attendee_id
+    ).delete(synchronize_session=False)
+    session.add(
+        MasterclassAttendee(attendee_id=attendee_id, masterclass_id=masterclass_id)
+    )
+    queue_booking_confirmations(masterclass_id, [attendee_id], session=session)
+    try:
+        session.commit()
+    except IntegrityError:
+        # Another request booked this user in between our check and insert
+        session.rollback()
+        return BookingOutcome.ALREADY_BOOKED
+    return BookingOutcome.BOOKED
+
+
+def join_waitlist(
+    masterclass_id: int, attendee_id: int, session=None
+) -> BookingOutcome:
+    """
+    Adds a user to the back of a masterclass's waitlist, then promotes
+    waiters in case a place was freed in the meantime, which may book this
+    user straight away.
+    """
+    session = session or db.session
+    already_booked = session.query(
+        session.query(MasterclassAttendee)
+        .filter_by(masterclass_id=masterclass_id, attendee_id=attendee_id)
+        .exists()
+    ).scalar()
+    if already_booked:
+        return BookingOutcome.ALREADY_BOOKED
+    already_waitlisted = session.query(
+        session.query(WaitlistEntry)
+        .filter_by(masterclass_id=masterclass_id, attendee_id=attendee_id)
+        .exists()
+    ).scalar()
+    if already_waitlisted:
+        return BookingOutcome.ALREADY_WAITLISTED
+
+    # Joining under the masterclass lock lets promote_from_waitlist select
+    # the waiters it read by id range
+    _lock_masterclass(masterclass_id, session)
+    session.add(WaitlistEntry(masterclass_id=masterclass_id, attendee_id=attendee_id))
+    try:
+        session.commit()
+    except IntegrityError:
+        # Another request queued this user in between our check and insert
+        session.rollback()
+        return BookingOutcome.ALREADY_WAITLISTED
+
+    promote_from_waitlist(masterclass_id, session=session)
+    if (
+        session.query(WaitlistEntry)
+        .filter_by(masterclass_id=masterclass_id, attendee_id=attendee_id)
+        .count()
+    ):
+        return BookingOutcome.WAITLISTED
+    return BookingOutcome.BOOKED
+
+
+def promote_from_waitlist(masterclass_id: int, session=None, commit=True) -> int:
+    """
+    Books the longest waiting users onto a masterclass's free places, and
+    returns how many were promoted.
+
+    However many are promoted it takes the same seven statements. Locking
+    the masterclass row first queues this behind any signup, cancellation,
+    waitlist join or other promotion for the same masterclass. The free
+    places and that many waiters are then read, noting any who have already
+    booked. Since waiters only join under the same lock, the waiters read
+    are every entry up to the last one's id, so they are copied to the
+    attendee table and deleted with an INSERT ... SELECT and a DELETE over
+    that id range, without sending the ids back. booked_count goes up by
+    however many rows were copied, and confirmation emails for those
+    waiters are queued with a single executemany INSERT.
+
+    Pass commit=False to leave the promotion in the caller's transaction,
+    so that a place can be released and refilled atomically.
+    """
+    session = session or db.session
+    waitlist = WaitlistEntry.__table__
+    attendees = MasterclassAttendee.__table__
+
+    _lock_masterclass(masterclass_id, session)
+    free_places = (
+        session.query(Masterclass.max_attendees - Masterclass.booked_count)
+        .filter(Masterclass.id == masterclass_id)
+        .scalar()
+    )
+    already_booked = exists().where(
+        and_(
+            attendees.c.masterclass_id == masterclass_id,
+            attendees.c.attendee_id == waitlist.c.attendee_id,
+        )
+    )
+    waiters = []
+    if free_places and free_places > 0:
+        waiters = session.execute(
+            select(
+                [
+                    waitlist.c.id,
+                    waitlist.c.attendee_id,
+                    already_booked.label("already_booked"),
+                ]
+            )
+            .where(waitlist.c.masterclass_id == masterclass_id)
+            .order_by(waitlist.c.id)
+            .limit(free_places)
+        ).fetchall()
+
+    promoted = 0
+    if waiters:
+        promoted_waiters = and_(
+            waitlist.c.masterclass_id == masterclass_id,
+            waitlist.c.id <= waiters[-1].id,
+        )
+        promoted = session.execute(
+            attendees.insert().from_select(
+                ["attendee_id", "masterclass_id", "created_at"],
+                select(
+                    [waitlist.c.attendee_id, waitlist.c.masterclass_id, func.now()]
+                ).where(and_(promoted_waiters, ~already_booked)),
+            )
+        ).rowcount
+        session.execute(waitlist.delete().where(promoted_waiters))
+        session.query(Masterclass).filter_by(id=masterclass_id).update(
+            {Masterclass.booked_count: Masterclass.booked_count + promoted},
+            synchronize_session=False,
+        )
+        # The masterclass lock keeps anyone else booking these waiters in
+        # between, so the ones not already booked are exactly those copied
+        newly_booked = [
+            waiter.attendee_id for waiter in waiters if not waiter.already_booked
+        ]
+        if newly_booked:
+            queue_booking_confirmations(masterclass_id, newly_booked, session=session)
+
+    if commit:
+        session.commit()
+    return promoted
+
+
+def change_capacity(masterclass_id: int, max_attendees: int, session=None) -> int:
+    """
+    Sets how many people a masterclass can take and, if that frees up
+    places, fills them from the waitlist in the same transaction. Returns
+    how many waiters were promoted.
+    """
+    session = session or db.session
+    session.query(Masterclass).filter_by(id=masterclass_id).update(
+        {Masterclass.max_attendees: max_attendees}, synchronize_session=False
+    )
+    promoted = promote_from_waitlist(masterclass_id, session=session, commit=False)
+    session.commit()
+    return promoted
+
+
+def cancel_booking(
+    masterclass_id: int, attendee_id: int, session=None
+) -> BookingOutcome:
+    """
+    Cancels a user's booking, releasing their place and giving it to the
+    next user on the waitlist, all in one transaction.
+
+    The masterclass row is locked before the booking is deleted, the same
+    order reserve_seat takes them in, so a cancellation and a signup can't
+    deadlock. A repeated cancellation waits for the first and then finds
+    nothing to delete, so double submits release the place only once.
+    """
+    session = session or db.session
+    _lock_masterclass(masterclass_id, session)
+    removed = (
+        session.query(MasterclassAttendee)
+        .filter_by(masterclass_id=masterclass_id, attendee_id=attendee_id)
+        .delete(synchronize_session=False)
+    )
+    if not removed:
+        session.commit()
+        return BookingOutcome.NOT_BOOKED
+
+    session.query(Masterclass).filter_by(id=masterclass_id).update(
+        {Masterclass.booked_count: Masterclass.booked_count - removed},
+        synchronize_session=False,
+    )
+    promote_from_waitlist(masterclass_id, session=session, commit=False)
+    session.commit()
+    return BookingOutcome.CANCELLED
+
+
+def _lock_masterclass(masterclass_id: int, session):
+    # A no-op UPDATE takes the row lock on Postgres and the write lock on
+    # SQLite, where SELECT ... FOR UPDATE isn't supported. Setting updated_at
+    # to itself stops its onupdate moving it, which would invalidate cached
+    # pages and feeds of the masterclass when nothing about it has changed.
+    session.query(Masterclass).filter_by(id=masterclass_id).update(
+        {
+            Masterclass.booked_count: Masterclass.booked_count,
+            Masterclass.updated_at: Masterclass.updated_at,
+        },
+        synchronize_session=False,
+    )
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+from app.metrics import CACHE_LOOKUPS
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded least recently used cache for use within a
+    single process. Entries optionally expire ttl seconds after being set.
+    Lookups in a cache given a name are counted in the Prometheus metrics.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = None, name: str = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._hit_counter = CACHE_LOOKUPS.labels(name, "hit") if name else None
+        self._miss_counter = CACHE_LOOKUPS.labels(name, "miss") if name else None
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if self._hit_counter:
+                    self._hit_counter.inc()
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            if self._miss_counter:
+                self._miss_counter.inc()
+            return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
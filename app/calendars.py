@@ -0,0 +1,141 @@
+"""
+iCalendar (RFC 5545) feeds of masterclasses, for calendar clients to
+subscribe to.
+
+A feed's bytes depend only on the masterclasses in it and the host it's
+served from, so the same version of a feed is always byte for byte the same
+and can carry a strong ETag. That's why DTSTAMP is when the masterclass last
+changed rather than when the feed was generated. Times are floating local
+times, as masterclass timestamps carry no time zone.
+"""
+
+from datetime import datetime
+from typing import Callable, Iterable
+
+from flask import url_for
+
+from app.cache import LRUCache
+
+PRODUCT_ID = "-//DDaT Masterclasses//Masterclasses//EN"
+
+
+def escape_text(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold(line: str) -> str:
+    """
+    Splits a content line into lines of at most 75 octets, each continuation
+    starting with a space, without breaking a UTF-8 character in two.
+    """
+    folded, current, size = [], "", 0
+    for character in line:
+        length = len(character.encode())
+        if size + length > 75:
+            folded.append(current)
+            current, size = " ", 1
+        current += character
+        size += length
+    folded.append(current)
+    return "\r\n".join(folded)
+
+
+def format_time(timestamp: datetime, utc: bool = False) -> str:
+    return timestamp.strftime("%Y%m%dT%H%M%S") + ("Z" if utc else "")
+
+
+def _event_lines(masterclass, uid_domain: str, attending: bool) -> list:
+    name = masterclass.content.name if masterclass.content else "Masterclass"
+    url = url_for(
+        "main_bp.masterclass_profile", masterclass_id=masterclass.id, _external=True
+    )
+    if masterclass.is_remote:
+        location = "Online"
+    elif masterclass.location:
+        location = ", ".join(
+            part
+            for part in (masterclass.location.name, masterclass.location.address)
+            if part
+        )
+    else:
+        location = ""
+    description = f"Details and booking: {url}"
+    if attending and masterclass.is_remote and masterclass.remote_url:
+        description += f"\nJoining link: {masterclass.remote_url}"
+
+    changed_at = masterclass.updated_at or masterclass.timestamp
+    return [
+        "BEGIN:VEVENT",
+        f"UID:masterclass-{masterclass.id}@{uid_domain}",
+        f"DTSTAMP:{format_time(changed_at, utc=True)}",
+        f"LAST-MODIFIED:{format_time(changed_at, utc=True)}",
+        f"SEQUENCE:{masterclass.version or 0}",
+        f"DTSTART:{format_time(masterclass.timestamp)}",
+        f"SUMMARY:{escape_text(name)}",
+        f"LOCATION:{escape_text(location)}",
+        f"DESCRIPTION:{escape_text(description)}",
+        f"URL:{url}",
+        "END:VEVENT",
+    ]
+
+
+def to_ical(
+    name: str, masterclasses: Iterable, uid_domain: str, attending: bool = False
+) -> bytes:
+    """
+    Returns an iCalendar feed with an event for each masterclass that has a
+    time set. Joining links for online masterclasses are only included when
+    attending is set, as on the profile page.
+    """
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODUCT_ID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(name)}",
+    ]
+    for masterclass in masterclasses:
+        if masterclass.timestamp is not None:
+            lines.extend(_event_lines(masterclass, uid_domain, attending))
+    lines.append("END:VCALENDAR")
+    return "".join(fold(line) + "\r\n" for line in lines).encode()
+
+
+class CalendarFeeds:
+    """
+    Caches rendered feeds, keyed by a version which changes whenever the
+    feed would, such as User.bookings_version. Calendar clients poll every
+    few minutes, so most polls that don't get a 304 are served from here.
+    """
+
+    def __init__(self):
+        self.cache = LRUCache()
+
+    def init_app(self, app):
+        self.cache = LRUCache(
+            maxsize=app.config["CALENDAR_CACHE_SIZE"], name="calendars"
+        )
+
+    def render(
+        self,
+        key: tuple,
+        name: str,
+        load_masterclasses: Callable[[], Iterable],
+        uid_domain: str,
+        attending: bool = False,
+    ) -> bytes:
+        feed = self.cache.get(key)
+        if feed is None:
+            feed = to_ical(name, load_masterclasses(), uid_domain, attending=attending)
+            self.cache.set(key, feed)
+        return feed
+
+
+calendar_feeds = CalendarFeeds()
@@ -0,0 +1,55 @@
+from threading import Lock
+import time
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing dependency. After failure_threshold failures in a
+    row the breaker opens and refuses calls for reset_after seconds, then lets
+    a single trial call through: if it succeeds the breaker closes again, if it
+    fails the breaker stays open for another reset_after seconds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_after:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.reset()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
@@ -0,0 +1,77 @@
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app import db, importer
+from app.bookings import promote_from_waitlist
+from app.jobs import job_queue
+from app.models import Masterclass, WaitlistEntry
+
+
+@click.command("reconcile-booked-counts")
+@with_appcontext
+def reconcile_booked_counts():
+    """Repair drift between Masterclass.booked_count and the attendee table."""
+    repaired = Masterclass.reconcile_booked_counts()
+    click.echo(f"Repaired booked count for {repaired} masterclass(es).")
+
+
+@click.command("promote-waitlists")
+@with_appcontext
+def promote_waitlists():
+    """Fill free places on every masterclass from its waitlist."""
+    masterclass_ids = [
+        id
+        for id, in db.session.query(WaitlistEntry.masterclass_id)
+        .join(Masterclass)
+        .filter(Masterclass.booked_count < Masterclass.max_attendees)
+        .distinct()
+    ]
+    promoted = sum(promote_from_waitlist(id) for id in masterclass_ids)
+    click.echo(
+        f"Promoted {promoted} waiting user(s) on {len(masterclass_ids)} masterclass(es)."
+    )
+
+
+@click.command("run-worker")
+@click.option("--burst", is_flag=True, help="Stop once there are no jobs due.")
+@with_appcontext
+def run_worker(burst):
+    """Run queued background jobs, such as sending booking emails."""
+    job_queue.work(burst=burst)
+
+
+@click.command("sweep-sessions")
+@with_appcontext
+def sweep_sessions():
+    """Delete expired server-side sessions."""
+    swept = current_app.session_interface.store.sweep()
+    click.echo(f"Deleted {swept} expired session(s).")
+
+
+@click.command("import-data")
+@click.argument("kind", type=click.Choice(["users", "content", "masterclasses"]))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=1000, show_default=True)
+@click.option("--dry-run", is_flag=True, help="Only validate the file.")
+@with_appcontext
+def import_data(kind, path, batch_size, dry_run):
+    """Bulk import users, content or masterclasses from a .csv or .jsonl file."""
+    row_count, errors = importer.validate_file(kind, path, batch_size)
+    if errors:
+        for error in errors:
+            click.echo(error, err=True)
+        raise click.ClickException("The file has problems, so nothing was imported.")
+    if dry_run:
+        click.echo(f"All {row_count} row(s) are valid.")
+        return
+
+    start = time.perf_counter()
+    imported = importer.import_file(kind, path, batch_size)
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"Imported {imported} row(s) in {elapsed:.1f}s "
+        f"({imported / max(elapsed, 1e-6):.0f} rows/second)."
+    )
@@ -0,0 +1,38 @@
+from typing import Union
+import hashlib
+
+from flask import Response, current_app, request
+
+
+def make_etag(*validators) -> str:
+    """
+    Builds an ETag from cheap values that change whenever the page would,
+    such as version stamps read from the database, plus the RELEASE so that
+    a deploy with new templates doesn't keep serving old pages.
+    """
+    key = repr((current_app.config["RELEASE"],) + validators)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def not_modified(etag: str) -> Union[None, Response]:
+    """
+    Returns a 304 response if the client's copy of the page is current, so the
+    view can return before rendering anything. Otherwise returns None.
+
+    Only the ETag is compared. The pages also depend on who is looking at
+    them, which no Last-Modified date covers, so If-Modified-Since is ignored.
+    """
+    if not request.if_none_match.contains(etag):
+        return None
+    return add_validators(Response(status=304), etag)
+
+
+def add_validators(response: Response, etag: str) -> Response:
+    """
+    Sets the ETag on a response, and asks browsers to revalidate it on every
+    use since the pages are private to the user.
+    """
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
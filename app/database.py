@@ -0,0 +1,96 @@
+"""
+Engine settings and read replica routing for Flask-SQLAlchemy.
+
+Views decorated with @reads_from_replica run their SELECTs against the
+REPLICA_DATABASE_URL database when one is configured. Everything else goes
+to the primary: writes, any read after a write in the same request, reads
+outside those views, and every read for REPLICA_PIN_SECONDS after a user's
+request wrote something, so they see their own signup straight away even if
+the replica is behind.
+"""
+
+from functools import wraps
+import time
+
+from flask import current_app, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import orm
+from sqlalchemy.sql.selectable import SelectBase
+
+REPLICA_BIND = "replica"
+USE_REPLICA_KEY = "app.use_replica"
+WROTE_KEY = "app.wrote_to_primary"
+PIN_SESSION_KEY = "primary_until"
+
+
+def reads_from_replica(view):
+    """Lets a view's reads go to the replica when it handles a GET or HEAD."""
+
+    @wraps(view)
+    def decorated_view(*args, **kwargs):
+        if request.method in ("GET", "HEAD") and not _pinned_to_primary():
+            request.environ[USE_REPLICA_KEY] = True
+        return view(*args, **kwargs)
+
+    return decorated_view
+
+
+def _pinned_to_primary() -> bool:
+    return session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context():
+            if not isinstance(clause, SelectBase) or self._flushing:
+                request.environ[WROTE_KEY] = True
+            elif request.environ.get(USE_REPLICA_KEY) and not request.environ.get(
+                WROTE_KEY
+            ):
+                replica = self.db.replica_engine(self.app)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def init_app(self, app):
+        app.config.setdefault("REPLICA_DATABASE_URL", None)
+        if app.config["REPLICA_DATABASE_URL"]:
+            binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+            binds[REPLICA_BIND] = app.config["REPLICA_DATABASE_URL"]
+            app.config["SQLALCHEMY_BINDS"] = binds
+            app.after_request(_pin_after_write)
+        super().init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def replica_engine(self, app=None):
+        app = self.get_app(app)
+        if not app.config["REPLICA_DATABASE_URL"]:
+            return None
+        return self.get_engine(app, bind=REPLICA_BIND)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        # Flask-SQLAlchemy chooses SQLite's pools itself, which take no sizes
+        if not sa_url.drivername.startswith("sqlite"):
+            options.setdefault("pool_size", app.config["DATABASE_POOL_SIZE"])
+            options.setdefault("max_overflow", app.config["DATABASE_MAX_OVERFLOW"])
+            options.setdefault("pool_timeout", app.config["DATABASE_POOL_TIMEOUT"])
+            options.setdefault("pool_recycle", app.config["DATABASE_POOL_RECYCLE"])
+        options.setdefault("pool_pre_ping", app.config["DATABASE_POOL_PRE_PING"])
+        return super().apply_driver_hacks(app, sa_url, options)
+
+
+def _pin_after_write(response):
+    # Commits on the primary may not have reached the replica yet
+    if request.environ.get(WROTE_KEY) and request.method not in ("GET", "HEAD"):
+        session[PIN_SESSION_KEY] = (
+            time.time() + current_app.config["REPLICA_PIN_SECONDS"]
+        )
+    return response
@@ -0,0 +1,33 @@
+from flask import current_app
+from markupsafe import Markup
+
+from app.cache import LRUCache
+
+
+class MasterclassCards:
+    """
+    Caches each masterclass's rendered catalogue card, keyed by its id and
+    version. Any change to what the card shows bumps Masterclass.version, so a
+    stale card is never looked up again and simply ages out of the cache.
+    """
+
+    template = "partials/masterclass-card.html"
+
+    def __init__(self):
+        self.cache = LRUCache()
+
+    def init_app(self, app):
+        self.cache = LRUCache(maxsize=app.config["CARD_CACHE_SIZE"], name="cards")
+        app.add_template_global(self.render, name="masterclass_card")
+
+    def render(self, masterclass) -> Markup:
+        key = (masterclass.id, masterclass.version)
+        card = self.cache.get(key)
+        if card is None:
+            template = current_app.jinja_env.get_template(self.template)
+            card = Markup(template.render(masterclass=masterclass))
+            self.cache.set(key, card)
+        return card
+
+
+masterclass_cards = MasterclassCards()
@@ -0,0 +1,263 @@
+"""
+Bulk import of users, masterclass content and masterclasses from CSV or JSON
+Lines files, used by the `flask import-data` command.
+
+Files are read twice, a row at a time: first every row is validated, and
+only if there are no problems are rows written, in batches of executemany
+INSERTs with one transaction per batch.
+"""
+
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
+import csv
+import json
+
+from sqlalchemy import bindparam
+
+from app import db
+from app.models import Location, Masterclass, MasterclassContent, User
+
+MAX_ERRORS = 100
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def read_rows(path: str) -> Iterator[Tuple[int, dict]]:
+    """
+    Yields (line number, row) for each row of a .csv or .jsonl file. A JSON
+    line that isn't an object is yielded as the InvalidRow describing it, so
+    that it's reported along with every other problem in the file.
+    """
+    with open(path, newline="") as file:
+        if path.endswith(".jsonl"):
+            for line_number, line in enumerate(file, start=1):
+                if line.strip():
+                    yield line_number, _json_row(line)
+        else:
+            # Line 1 is the header
+            yield from enumerate(csv.DictReader(file), start=2)
+
+
+def _json_row(line: str):
+    try:
+        row = json.loads(line)
+    except ValueError as error:
+        return InvalidRow(f"not valid JSON ({error})")
+    if not isinstance(row, dict):
+        return InvalidRow("not a JSON object")
+    return row
+
+
+def _text(row: dict, field: str, max_length: int = None, required=False):
+    value = row.get(field)
+    value = str(value).strip() if value not in (None, "") else None
+    if required and value is None:
+        raise InvalidRow(f"{field} is required")
+    if value is not None and max_length and len(value) > max_length:
+        raise InvalidRow(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def _integer(row: dict, field: str, required=False):
+    value = _text(row, field, required=required)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        raise InvalidRow(f"{field} must be a whole number")
+
+
+def _boolean(row: dict, field: str, default: bool):
+    value = row.get(field)
+    if value in (None, ""):
+        return default
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("true", "yes", "1"):
+        return True
+    if str(value).lower() in ("false", "no", "0"):
+        return False
+    raise InvalidRow(f"{field} must be true or false")
+
+
+def _timestamp(row: dict, field: str):
+    value = _text(row, field, required=True)
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidRow(f"{field} must be an ISO 8601 date and time")
+
+
+def _clean_user(row: dict) -> dict:
+    return {
+        "email": _text(row, "email", 120, required=True),
+        "first_name": _text(row, "first_name", 50),
+        "last_name": _text(row, "last_name", 50),
+        "draft": _boolean(row, "draft", default=True),
+    }
+
+
+def _clean_content(row: dict) -> dict:
+    return {
+        "name": _text(row, "name", 150, required=True),
+        "description": _text(row, "description", 500),
+        "category": _text(row, "category", 200),
+    }
+
+
+def _clean_masterclass(row: dict) -> dict:
+    return {
+        "timestamp": _timestamp(row, "timestamp"),
+        "max_attendees": _integer(row, "max_attendees", required=True),
+        "is_remote": _boolean(row, "is_remote", default=False),
+        "remote_url": _text(row, "remote_url"),
+        "remote_joining_instructions": _text(row, "remote_joining_instructions"),
+        "room": _text(row, "room"),
+        "floor": _text(row, "floor"),
+        "building_instructions": _text(row, "building_instructions"),
+        "masterclass_content_id": _integer(
+            row, "masterclass_content_id", required=True
+        ),
+        "location_id": _integer(row, "location_id"),
+        "instructor_email": _text(row, "instructor_email", required=True),
+        "draft": _boolean(row, "draft", default=False),
+    }
+
+
+class BatchValidator:
+    """
+    Cleans rows a batch at a time, checking references against the database
+    with one query per batch rather than one per row. Remembers the emails it
+    has seen so duplicate users within a file are caught.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.seen_emails = set()
+
+    def clean(self, batch: List[Tuple[int, dict]]) -> Tuple[List[dict], List[str]]:
+        clean_function = {
+            "users": _clean_user,
+            "content": _clean_content,
+            "masterclasses": _clean_masterclass,
+        }[self.kind]
+        rows, errors = [], []
+        for line_number, row in batch:
+            try:
+                if isinstance(row, InvalidRow):
+                    raise row
+                rows.append((line_number, clean_function(row)))
+            except InvalidRow as error:
+                errors.append(f"line {line_number}: {error}")
+        if self.kind == "users":
+            rows, reference_errors = self._check_new_users(rows)
+        elif self.kind == "masterclasses":
+            rows, reference_errors = self._resolve_masterclass_references(rows)
+        else:
+            reference_errors = []
+        return [row for _, row in rows], errors + reference_errors
+
+    def _check_new_users(self, rows):
+        emails = [row["email"] for _, row in rows]
+        existing = {
+            email
+            for email, in db.session.query(User.email)
+            .filter(User.email.in_(bindparam("emails", expanding=True)))
+            .params(emails=emails)
+        }
+        valid, errors = [], []
+        for line_number, row in rows:
+            if row["email"] in existing or row["email"] in self.seen_emails:
+                errors.append(f"line {line_number}: {row['email']} already exists")
+            else:
+                self.seen_emails.add(row["email"])
+                valid.append((line_number, row))
+        return valid, errors
+
+    def _resolve_masterclass_references(self, rows):
+        instructor_ids = self._ids_by(
+            User.email, User.id, [r["instructor_email"] for _, r in rows]
+        )
+        content_ids = self._ids_by(
+            MasterclassContent.id,
+            MasterclassContent.id,
+            [r["masterclass_content_id"] for _, r in rows],
+        )
+        location_ids = self._ids_by(
+            Location.id,
+            Location.id,
+            [r["location_id"] for _, r in rows if r["location_id"]],
+        )
+        valid, errors = [], []
+        for line_number, row in rows:
+            instructor_email = row.pop("instructor_email")
+            if instructor_email not in instructor_ids:
+                errors.append(
+                    f"line {line_number}: no user with email {instructor_email}"
+                )
+            elif row["masterclass_content_id"] not in content_ids:
+                errors.append(
+                    f"line {line_number}: no content with id {row['masterclass_content_id']}"
+                )
+            elif row["location_id"] and row["location_id"] not in location_ids:
+                errors.append(
+                    f"line {line_number}: no location with id {row['location_id']}"
+                )
+            else:
+                row["instructor_id"] = instructor_ids[instructor_email]
+                valid.append((line_number, row))
+        return valid, errors
+
+    @staticmethod
+    def _ids_by(key_column, id_column, keys) -> Dict:
+        # An expanding parameter keeps a large IN list cheap to compile
+        return dict(
+            db.session.query(key_column, id_column)
+            .filter(key_column.in_(bindparam("keys", expanding=True)))
+            .params(keys=list(set(keys)))
+        )
+
+
+def _batches(rows: Iterator, batch_size: int) -> Iterator[list]:
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def validate_file(kind: str, path: str, batch_size: int) -> Tuple[int, List[str]]:
+    """
+    Validates every row of a file without writing anything. Returns the
+    number of rows and the first MAX_ERRORS problems found.
+    """
+    validator = BatchValidator(kind)
+    row_count, errors = 0, []
+    for batch in _batches(read_rows(path), batch_size):
+        row_count += len(batch)
+        errors.extend(validator.clean(batch)[1][0 : MAX_ERRORS - len(errors)])
+    return row_count, errors
+
+
+def import_file(kind: str, path: str, batch_size: int) -> int:
+    """
+    Inserts the rows of an already validated file, committing each batch
+    separately. Returns the number of rows imported.
+    """
+    table = {
+        "users": User,
+        "content": MasterclassContent,
+        "masterclasses": Masterclass,
+    }[kind].__table__
+    validator = BatchValidator(kind)
+    imported = 0
+    for batch in _batches(read_rows(path), batch_size):
+        rows, errors = validator.clean(batch)
+        if errors:
+            raise InvalidRow(errors[0])
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+        imported += len(rows)
+    return imported
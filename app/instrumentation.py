@@ -0,0 +1,134 @@
+import heapq
+import json
+import logging
+import time
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "app.sql_stats"
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more queries than SQL_QUERY_BUDGET allows."""
+
+
+class RequestQueryStats:
+    """The SQL statements run while handling one request."""
+
+    def __init__(self, keep_slowest: int):
+        self.count = 0
+        self.total_ms = 0.0
+        self.keep_slowest = keep_slowest
+        self._slowest = []
+
+    def record(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        entry = (elapsed_ms, self.count, statement)
+        if len(self._slowest) < self.keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    def slowest(self):
+        return [
+            {"ms": round(elapsed_ms, 3), "statement": " ".join(statement.split())[:500]}
+            for elapsed_ms, _, statement in sorted(self._slowest, reverse=True)
+        ]
+
+
+class SQLInstrumentation:
+    """
+    Counts and times the SQL each request runs, when SQL_INSTRUMENTATION is
+    on. The totals go out in a Server-Timing header and a JSON log line, and
+    requests over SQL_QUERY_BUDGET are logged, or fail outright when
+    SQL_QUERY_BUDGET_STRICT is set, as it is in the tests.
+
+    Statements are counted from the session being loaded up to the response
+    being returned, so saving the session afterwards isn't included.
+    """
+
+    def init_app(self, app):
+        if not app.config["SQL_INSTRUMENTATION"]:
+            return
+        # Nothing configures logging under gunicorn, so without a handler and
+        # level of its own the INFO lines would never be written
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+            event.listen(Engine, "handle_error", _handle_error)
+        app.after_request(self.report)
+
+    def report(self, response):
+        stats = request.environ.get(STATS_KEY)
+        if stats is None:
+            return response
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries"',
+        )
+        logger.info(
+            json.dumps(
+                {
+                    "event": "request_sql",
+                    "method": request.method,
+                    "path": request.path,
+                    "endpoint": request.endpoint,
+                    "status": response.status_code,
+                    "queries": stats.count,
+                    "db_ms": round(stats.total_ms, 3),
+                    "slowest": stats.slowest(),
+                }
+            )
+        )
+        budget = current_app.config["SQL_QUERY_BUDGET"]
+        if budget is not None and stats.count > budget:
+            message = (
+                f"{request.method} {request.path} ran {stats.count} queries, "
+                f"over the budget of {budget}"
+            )
+            if current_app.config["SQL_QUERY_BUDGET_STRICT"]:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def _stats():
+    if not has_request_context():
+        return None
+    stats = request.environ.get(STATS_KEY)
+    if stats is None and current_app.config["SQL_INSTRUMENTATION"]:
+        stats = request.environ[STATS_KEY] = RequestQueryStats(
+            current_app.config["SQL_SLOWEST_STATEMENTS"]
+        )
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info["query_started_at"].pop()
+    stats = _stats()
+    if stats is not None:
+        stats.record(statement, (time.perf_counter() - started_at) * 1000)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started_at"):
+        connection.info["query_started_at"].pop()
+
+
+sql_instrumentation = SQLInstrumentation()
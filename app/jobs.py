@@ -0,0 +1,176 @@
+"""
+A job queue kept in the job table, run by `flask run-worker`.
+
+Requests add jobs to their own session with job_queue.enqueue, so a job is
+only queued if the rest of the request's changes are committed, and the
+request never waits for the work itself. Workers claim jobs in batches and
+run them at least once: a job whose worker dies part way through is claimed
+again once its lock is JOB_LOCK_TIMEOUT seconds old, so handlers should
+cope with repeating themselves.
+"""
+
+from datetime import datetime, timedelta
+from secrets import token_hex
+import logging
+import os
+import signal
+import socket
+import time
+
+from sqlalchemy import and_, or_
+
+from app import db
+from app.metrics import JOBS
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self):
+        self.handlers = {}
+        self.batch_size = 20
+        self.max_attempts = 5
+        self.retry_seconds = 30
+        self.poll_seconds = 5
+        self.lock_timeout = 600
+        self._stopping = False
+
+    def init_app(self, app):
+        self.batch_size = app.config["JOB_BATCH_SIZE"]
+        self.max_attempts = app.config["JOB_MAX_ATTEMPTS"]
+        self.retry_seconds = app.config["JOB_RETRY_SECONDS"]
+        self.poll_seconds = app.config["JOB_POLL_SECONDS"]
+        self.lock_timeout = app.config["JOB_LOCK_TIMEOUT"]
+
+    def handler(self, kind: str):
+        """Registers the function which runs jobs of a kind with their payload."""
+
+        def register(function):
+            self.handlers[kind] = function
+            return function
+
+        return register
+
+    @staticmethod
+    def enqueue(kind: str, payload: dict, run_at=None, session=None) -> Job:
+        """
+        Adds a job to the session, to be run once it's committed and run_at
+        has passed.
+        """
+        session = session or db.session
+        job = Job(kind=kind, payload=payload, run_at=run_at or datetime.utcnow())
+        session.add(job)
+        return job
+
+    @staticmethod
+    def enqueue_many(kind: str, payloads: list, session=None):
+        """Queues a job for each payload with a single executemany INSERT."""
+        session = session or db.session
+        now = datetime.utcnow()
+        session.bulk_insert_mappings(
+            Job, [{"kind": kind, "payload": p, "run_at": now} for p in payloads]
+        )
+
+    def claim(self) -> list:
+        """
+        Locks up to JOB_BATCH_SIZE jobs that are due for this worker.
+
+        On Postgres, SELECT ... FOR UPDATE SKIP LOCKED gives workers
+        claiming at the same time different rows, rather than making them
+        queue on each other's. SQLite has no row locks and SQLAlchemy leaves
+        FOR UPDATE out, so there the UPDATE checks again that each job is
+        still unclaimed, which is safe as SQLite runs one writer at a time.
+        """
+        now = datetime.utcnow()
+        claimable = and_(
+            Job.failed_at.is_(None),
+            Job.run_at <= now,
+            or_(
+                Job.locked_at.is_(None),
+                Job.locked_at < now - timedelta(seconds=self.lock_timeout),
+            ),
+        )
+        ids = [
+            id
+            for id, in db.session.query(Job.id)
+            .filter(claimable)
+            .order_by(Job.run_at, Job.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ]
+        if not ids:
+            db.session.commit()
+            return []
+
+        claim = f"{socket.gethostname()}:{os.getpid()}:{token_hex(4)}"[-64:]
+        db.session.query(Job).filter(Job.id.in_(ids), claimable).update(
+            {Job.locked_at: now, Job.locked_by: claim}, synchronize_session=False
+        )
+        db.session.commit()
+        return Job.query.filter_by(locked_by=claim).order_by(Job.run_at, Job.id).all()
+
+    def run_batch(self) -> int:
+        """Claims and runs a batch of jobs, returning how many were claimed."""
+        jobs = self.claim()
+        for job in jobs:
+            self._run(job)
+        return len(jobs)
+
+    def work(self, burst: bool = False):
+        """
+        Runs jobs until SIGINT or SIGTERM, polling every JOB_POLL_SECONDS
+        when there's nothing to do, or until the queue is empty with burst.
+        A signal lets the job in hand finish first.
+        """
+        self._stopping = False
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self._stop)
+        while not self._stopping:
+            if self.run_batch():
+                continue
+            if burst:
+                break
+            time.sleep(self.poll_seconds)
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _run(self, job: Job):
+        handler = self.handlers.get(job.kind)
+        # A failed handler's writes are undone without losing the claim
+        savepoint = db.session.begin_nested()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for {job.kind} jobs")
+            handler(**job.payload)
+            savepoint.commit()
+        except Exception as error:
+            savepoint.rollback()
+            self._retry_or_fail(job, error)
+        else:
+            db.session.delete(job)
+            JOBS.labels(job.kind, "succeeded").inc()
+        db.session.commit()
+
+    def _retry_or_fail(self, job: Job, error: Exception):
+        now = datetime.utcnow()
+        job.attempts += 1
+        job.last_error = repr(error)
+        job.locked_at = job.locked_by = None
+        if job.attempts >= self.max_attempts:
+            job.failed_at = now
+            JOBS.labels(job.kind, "failed").inc()
+            logger.exception("Job %s (%s) failed for good", job.id, job.kind)
+        else:
+            # Back off exponentially: JOB_RETRY_SECONDS, then twice that, ...
+            job.run_at = now + timedelta(
+                seconds=self.retry_seconds * 2 ** (job.attempts - 1)
+            )
+            JOBS.labels(job.kind, "retried").inc()
+            logger.warning(
+                "Job %s (%s) failed, retrying at %s", job.id, job.kind, job.run_at
+            )
+
+
+job_queue = JobQueue()
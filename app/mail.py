@@ -0,0 +1,72 @@
+from email.message import EmailMessage
+from pathlib import Path
+from uuid import uuid4
+import smtplib
+
+
+class SMTPSink:
+    """
+    Sends mail through an SMTP server. For local testing run a debugging
+    server that prints what it receives, such as `python -m aiosmtpd -n -l
+    localhost:1025`.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def send(self, message: EmailMessage):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(message)
+
+
+class FileSink:
+    """Writes each message to an .eml file in a directory instead of sending it."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def send(self, message: EmailMessage):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so nothing reading the directory sees half a file
+        path = self.directory / f"{uuid4().hex}.eml"
+        partial = path.with_suffix(".tmp")
+        partial.write_bytes(message.as_bytes())
+        partial.rename(path)
+
+
+class Mailer:
+    """
+    Sends plain text email through the MAIL_BACKEND sink: "smtp" or "file".
+    Mail is only sent from background jobs, never while handling a request.
+    """
+
+    def __init__(self):
+        self.sink = None
+        self.sender = None
+
+    def init_app(self, app):
+        backend = app.config["MAIL_BACKEND"]
+        if backend == "smtp":
+            self.sink = SMTPSink(
+                app.config["MAIL_SERVER"],
+                app.config["MAIL_PORT"],
+                timeout=app.config["MAIL_TIMEOUT"],
+            )
+        elif backend == "file":
+            self.sink = FileSink(app.config["MAIL_FILE_DIR"])
+        else:
+            raise ValueError(f"Unknown MAIL_BACKEND {backend!r}")
+        self.sender = app.config["MAIL_SENDER"]
+
+    def send(self, to: str, subject: str, body: str):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(body)
+        self.sink.send(message)
+
+
+mailer = Mailer()
@@ -0,0 +1,124 @@
+"""
+Prometheus metrics, served from /metrics.
+
+Under a multi-process server set the prometheus_multiproc_dir environment
+variable to an empty directory shared by the workers before the app is
+imported. Each worker then writes its values to memory-mapped files there,
+and /metrics adds them up across every worker rather than reporting
+whichever one answered the scrape.
+"""
+
+import os
+import time
+
+from flask import Response, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+from app import db
+
+REQUESTS = Counter(
+    "masterclasses_http_requests_total",
+    "Requests handled, by endpoint, method and status.",
+    ["endpoint", "method", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "masterclasses_http_request_duration_seconds",
+    "Time taken to handle a request, by endpoint.",
+    ["endpoint"],
+)
+DB_POOL_CHECKOUTS = Counter(
+    "masterclasses_db_pool_checkouts_total",
+    "Connections checked out of the database pool.",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "masterclasses_db_pool_checked_out",
+    "Database connections currently checked out.",
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "masterclasses_db_pool_overflow",
+    "Database connections open beyond the pool size.",
+    multiprocess_mode="livesum",
+)
+CACHE_LOOKUPS = Counter(
+    "masterclasses_cache_lookups_total",
+    "In-process cache lookups, by cache and whether they hit.",
+    ["cache", "result"],
+)
+PLACES_SEARCHES = Counter(
+    "masterclasses_places_searches_total",
+    "Place searches, by where the answer came from or why there wasn't one.",
+    ["outcome"],
+)
+PLACES_API_LATENCY = Histogram(
+    "masterclasses_places_api_duration_seconds",
+    "Time taken by calls to Google Places, including failed ones.",
+)
+JOBS = Counter(
+    "masterclasses_jobs_total",
+    "Background jobs run, by kind and outcome.",
+    ["kind", "outcome"],
+)
+
+STARTED_AT_KEY = "app.metrics_started_at"
+
+
+class Metrics:
+    def init_app(self, app):
+        app.before_request(self._start_timer)
+        app.after_request(self._record_request)
+        app.add_url_rule("/metrics", "metrics", self.export)
+
+        engine = db.get_engine(app)
+
+        @event.listens_for(engine.pool, "checkout")
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            DB_POOL_CHECKOUTS.inc()
+            DB_POOL_CHECKED_OUT.inc()
+            self._record_overflow(engine)
+
+        @event.listens_for(engine.pool, "checkin")
+        def checkin(dbapi_connection, connection_record):
+            DB_POOL_CHECKED_OUT.dec()
+            self._record_overflow(engine)
+
+    @staticmethod
+    def _record_overflow(engine):
+        # Only QueuePool can overflow; the engine's pool changes on dispose()
+        if hasattr(engine.pool, "overflow"):
+            DB_POOL_OVERFLOW.set(max(engine.pool.overflow(), 0))
+
+    @staticmethod
+    def _start_timer():
+        request.environ[STARTED_AT_KEY] = time.perf_counter()
+
+    @staticmethod
+    def _record_request(response):
+        started_at = request.environ.get(STARTED_AT_KEY)
+        endpoint = request.endpoint or "none"
+        REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+        if started_at is not None:
+            REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - started_at)
+        return response
+
+    @staticmethod
+    def export():
+        if "prometheus_multiproc_dir" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+metrics = Metrics()
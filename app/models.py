@@ -1,8 +1,12 @@
-from app import db, login
+from app import db
+from datetime import datetime, timedelta
+from secrets import token_urlsafe
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
-from typing import List, Union
-from sqlalchemy import or_
+from typing import List, NamedTuple, Tuple, Union
+from sqlalchemy import DDL, MetaData, and_, case, event, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, joinedload
 from sqlalchemy_serializer import SerializerMixin
 
 
@@ -15,10 +19,11 @@ class User(
     email = db.Column(
         db.String(120), nullable=False, index=True, unique=True
     )  # By indexing a value you can find it more easily in the db
-    first_name = db.Column(db.String(50), index=True, unique=False)
-    last_name = db.Column(db.String(50), index=True, unique=False)
+    first_name = db.Column(db.String(50), unique=False)
+    last_name = db.Column(db.String(50), unique=False)
     password_hash = db.Column(db.String(128), nullable=True)
     draft = db.Column(db.Boolean, default=True)
+    calendar_token = db.Column(db.String(64), index=True, unique=True)
 
     masterclasses_run = db.relationship(
         "Masterclass", backref="instructor", lazy="dynamic"
@@ -36,22 +41,85 @@ class User(
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def reset_calendar_token(self) -> str:
+        """
+        Gives the user a new secret for their calendar feed URLs, so that any
+        old URL stops working.
+        """
+        self.calendar_token = token_urlsafe(32)
+        return self.calendar_token
+
     def get_booked_masterclasses(self) -> List[Union["Masterclass", None]]:
         """
-        Returns a list of masterclass objects which the user is an attendee of.
+        Returns the masterclasses the user is an attendee of in date order,
+        with their content, location and instructor loaded in the same query.
         """
-        return [bm.masterclass for bm in self.booked_masterclasses]
+        if self.id is None:
+            return []
+        return (
+            Masterclass.query.join(MasterclassAttendee)
+            .filter(MasterclassAttendee.attendee_id == self.id)
+            .options(
+                joinedload(Masterclass.content),
+                joinedload(Masterclass.location),
+                joinedload(Masterclass.instructor),
+            )
+            .order_by(Masterclass.timestamp.asc(), Masterclass.id.asc())
+            .all()
+        )
 
-    @login.user_loader
-    def load_user(id):
-        return User.query.get(int(id))
+    def get_upcoming_and_past_masterclasses(self) -> "BookedMasterclasses":
+        """
+        Returns the user's booked masterclasses split into those still to
+        come, soonest first, and those already held, most recent first.
+        """
+        now = datetime.now()
+        upcoming, past = [], []
+        for masterclass in self.get_booked_masterclasses():
+            if masterclass.timestamp is not None and masterclass.timestamp <= now:
+                past.append(masterclass)
+            else:
+                upcoming.append(masterclass)
+        return BookedMasterclasses(upcoming=upcoming, past=past[::-1])
+
+    def bookings_version(self) -> Tuple[int, datetime, datetime, int]:
+        """
+        Returns how many bookings the user has, when the latest was made,
+        when any booked masterclass last changed and how many are yet to
+        happen, which between them change whenever the user's list of
+        masterclasses, or how it is split into upcoming and past, does.
+        """
+        return (
+            MasterclassAttendee.query.join(Masterclass)
+            .with_entities(
+                db.func.count(MasterclassAttendee.id),
+                db.func.max(MasterclassAttendee.created_at),
+                db.func.max(Masterclass.updated_at),
+                db.func.sum(
+                    case([(Masterclass.timestamp > datetime.now(), 1)], else_=0)
+                ),
+            )
+            .filter(MasterclassAttendee.attendee_id == self.id)
+            .one()
+        )
+
+
+class BookedMasterclasses(NamedTuple):
+    upcoming: List["Masterclass"]
+    past: List["Masterclass"]
+
+
+class MasterclassProfile(NamedTuple):
+    masterclass: "Masterclass"
+    already_attendee: bool
+    waitlist_position: int
 
 
 class MasterclassContent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150))
     description = db.Column(db.String(500))
-    category = db.Column(db.String(200))
+    category = db.Column(db.String(200), index=True)
     masterclass_instances = db.relationship(
         "Masterclass", backref="content", lazy="dynamic"
     )
@@ -60,19 +128,31 @@ class MasterclassContent(db.Model):
         return "<MasterclassContent {}>".format(self.name)
 
 
+# Searches matching at least this many locations aren't ranked, see _search
+COMMON_TERM_MATCHES = 500
+
+
+def has_trigram_tokenizer(dialect) -> bool:
+    """FTS5's trigram tokenizer arrived in SQLite 3.34."""
+    return dialect.dbapi.sqlite_version_info >= (3, 34, 0)
+
+
 class Location(db.Model, SerializerMixin):
+    # Search results only need the location itself, not every masterclass held there
+    serialize_rules = ("-masterclasses",)
+
     id = db.Column(db.Integer, primary_key=True)
-    building = db.Column(db.String(50), index=True)
+    building = db.Column(db.String(50))
     street_number = db.Column(
         db.String(10)
     )  # should keep numbers as strings unless going to do calculations?
-    street_name = db.Column(db.String(100), index=True)
-    town_or_city = db.Column(db.String(50), index=True)
+    street_name = db.Column(db.String(100))
+    town_or_city = db.Column(db.String(50))
     postcode = db.Column(
-        db.String(8), index=True
+        db.String(8)
     )  # A postcode in the UK can't have more than 8 characters inc. space
-    name = db.Column(db.String, index=True)
-    address = db.Column(db.String, index=True)
+    name = db.Column(db.String)  # Searched through location_search, not a B-tree index
+    address = db.Column(db.String)
     maps_id = db.Column(db.String, index=True)
     masterclasses = db.relationship("Masterclass", backref="location", lazy="dynamic")
 
@@ -80,34 +160,268 @@ class Location(db.Model, SerializerMixin):
         return "<Location {}>".format(self.name)
 
     @classmethod
-    def return_existing_location_or_none(cls, query: str) -> Union[None, "Location"]:
-        query = f"%{query}%"
-        return Location.query.filter(
-            or_(Location.name.ilike(query), Location.address.ilike(query))
-        ).all()
+    def return_existing_location_or_none(
+        cls, query: str, limit: int = None
+    ) -> List["Location"]:
+        """
+        Returns locations whose name or address contains the query, best
+        matches first.
+        """
+        return cls._search([query], limit)
+
+    @classmethod
+    def return_locations_matching_any_word(
+        cls, query: str, limit: int = None
+    ) -> List["Location"]:
+        """
+        Returns locations whose name or address contains any word of three or
+        more letters from the query. A looser search for when Google Places
+        can't be used.
+        """
+        words = [word for word in query.split() if len(word) >= 3]
+        return cls._search(words or [query], limit)
+
+    @classmethod
+    def _search(cls, terms: List[str], limit: int = None) -> List["Location"]:
+        # Uses the trigram search index for the database in use. Terms shorter
+        # than a trigram can't use it on SQLite and fall back to a scan, as do
+        # terms so common that ranking every match would take longer than
+        # scanning until the first few.
+        dialect = db.engine.dialect
+        if dialect.name == "sqlite":
+            if not has_trigram_tokenizer(dialect) or any(len(t) < 3 for t in terms):
+                return cls._search_ilike(terms).limit(limit).all()
+            matches = cls._search_fts(terms)
+            rank = location_search.c.rank
+        elif dialect.name == "postgresql":
+            matches = cls._search_ilike(terms)
+            query = " ".join(terms)
+            rank = db.func.greatest(
+                db.func.similarity(cls.name, query),
+                db.func.similarity(cls.address, query),
+            ).desc()
+        else:
+            return cls._search_ilike(terms).limit(limit).all()
+
+        count = cls._count_up_to(matches, COMMON_TERM_MATCHES)
+        if count == 0:
+            return []
+        if count >= COMMON_TERM_MATCHES:
+            return cls._search_ilike(terms).limit(limit).all()
+        return matches.order_by(rank).limit(limit).all()
+
+    @staticmethod
+    def _count_up_to(query, cap: int) -> int:
+        """Counts a query's rows, giving up once there are cap of them."""
+        capped = query.with_entities(Location.id).limit(cap).subquery()
+        return db.session.query(db.func.count()).select_from(capped).scalar()
+
+    @classmethod
+    def _search_fts(cls, terms: List[str]):
+        # Each term is quoted so FTS5 treats it as one substring, not as syntax
+        match = " OR ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        return cls.query.join(
+            location_search, location_search.c.rowid == cls.id
+        ).filter(db.literal_column("location_search").op("MATCH")(match))
+
+    @classmethod
+    def _search_ilike(cls, terms: List[str]):
+        return cls.query.filter(
+            or_(
+                *[
+                    column.ilike(f"%{term}%")
+                    for term in terms
+                    for column in (cls.name, cls.address)
+                ]
+            )
+        )
+
+
+# The search index over Location.name and Location.address. On SQLite it's an
+# FTS5 table using the trigram tokenizer, kept up to date by triggers, when
+# SQLite is new enough to have the tokenizer; older versions scan instead. On
+# Postgres it's a pair of pg_trgm GIN indexes, which ILIKE can use directly.
+location_search = db.Table(
+    "location_search",
+    MetaData(),
+    db.Column("rowid", db.Integer),
+    db.Column("name", db.String),
+    db.Column("address", db.String),
+    db.Column("rank", db.Float),
+)
+
+for statement in (
+    "CREATE VIRTUAL TABLE location_search USING fts5("
+    "name, address, content='location', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER location_search_ai AFTER INSERT ON location BEGIN "
+    "INSERT INTO location_search(rowid, name, address) "
+    "VALUES (new.id, new.name, new.address); END",
+    "CREATE TRIGGER location_search_ad AFTER DELETE ON location BEGIN "
+    "INSERT INTO location_search(location_search, rowid, name, address) "
+    "VALUES ('delete', old.id, old.name, old.address); END",
+    "CREATE TRIGGER location_search_au AFTER UPDATE ON location BEGIN "
+    "INSERT INTO location_search(location_search, rowid, name, address) "
+    "VALUES ('delete', old.id, old.name, old.address); "
+    "INSERT INTO location_search(rowid, name, address) "
+    "VALUES (new.id, new.name, new.address); END",
+):
+    event.listen(
+        Location.__table__,
+        "after_create",
+        DDL(statement).execute_if(
+            dialect="sqlite",
+            callable_=lambda ddl, target, bind, **kw: has_trigram_tokenizer(
+                bind.dialect
+            ),
+        ),
+    )
+event.listen(
+    Location.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS location_search").execute_if(dialect="sqlite"),
+)
+
+for statement in (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX ix_location_name_trgm ON location USING gin (name gin_trgm_ops)",
+    "CREATE INDEX ix_location_address_trgm ON location "
+    "USING gin (address gin_trgm_ops)",
+):
+    event.listen(
+        Location.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
 
 
 class Masterclass(db.Model):
+    __table_args__ = (
+        db.Index("ix_masterclass_draft_timestamp_id", "draft", "timestamp", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, index=True)
     max_attendees = db.Column(db.Integer)
-    is_remote = db.Column(db.Boolean, index=True)
-    remote_url = db.Column(db.String, index=True)
-    remote_joining_instructions = db.Column(db.String, index=True)
-    room = db.Column(db.String, index=True)
-    floor = db.Column(db.String, index=True)
-    building_instructions = db.Column(db.String, index=True)
+    booked_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+    is_remote = db.Column(db.Boolean)
+    remote_url = db.Column(db.String)
+    remote_joining_instructions = db.Column(db.String)
+    room = db.Column(db.String)
+    floor = db.Column(db.String)
+    building_instructions = db.Column(db.String)
     masterclass_content_id = db.Column(
-        db.Integer, db.ForeignKey("masterclass_content.id")
+        db.Integer, db.ForeignKey("masterclass_content.id"), index=True
     )
-    location_id = db.Column(db.Integer, db.ForeignKey("location.id"))
-    instructor_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    location_id = db.Column(db.Integer, db.ForeignKey("location.id"), index=True)
+    instructor_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
     attendees = db.relationship("MasterclassAttendee", backref="masterclass")
     masterclass_content = db.relationship("MasterclassContent")
     draft = db.Column(db.Boolean, default=True)
 
+    @classmethod
+    def upcoming_catalogue(
+        cls, after: Tuple[datetime, int] = None, limit: int = None
+    ) -> List["Masterclass"]:
+        """
+        Returns published masterclasses that haven't happened yet, in date
+        order, with their content, location and instructor loaded in the
+        same query, so rendering the catalogue doesn't issue a query per row.
+
+        Pages are fetched by keyset rather than offset: pass the (timestamp,
+        id) of the last masterclass on the previous page as `after`.
+        """
+        query = cls.query.filter_by(draft=False).filter(cls.timestamp > datetime.now())
+        if after is not None:
+            timestamp, id = after
+            query = query.filter(
+                or_(
+                    cls.timestamp > timestamp,
+                    and_(cls.timestamp == timestamp, cls.id > id),
+                )
+            )
+        return (
+            query.options(
+                joinedload(cls.content),
+                joinedload(cls.location),
+                joinedload(cls.instructor),
+            )
+            .order_by(cls.timestamp.asc(), cls.id.asc())
+            .limit(limit)
+            .all()
+        )
+
+    @classmethod
+    def catalogue_version(cls) -> Tuple[int, datetime]:
+        """
+        Returns how many masterclasses are in the catalogue and when the most
+        recent of them changed, which between them change whenever the
+        catalogue does.
+        """
+        return (
+            cls.query.with_entities(db.func.count(cls.id), db.func.max(cls.updated_at))
+            .filter_by(draft=False)
+            .filter(cls.timestamp > datetime.now())
+            .one()
+        )
+
+    @classmethod
+    def get_profile(
+        cls, masterclass_id: int, attendee_id: int
+    ) -> Union[None, "MasterclassProfile"]:
+        """
+        Returns a masterclass with its content, location and instructor,
+        whether the given user is attending it and their place on its waitlist
+        (0 if they aren't waiting), in a single query. Returns None if there's
+        no such masterclass.
+        """
+        already_attendee = db.exists().where(
+            and_(
+                MasterclassAttendee.masterclass_id == cls.id,
+                MasterclassAttendee.attendee_id == attendee_id,
+            )
+        )
+        row = (
+            db.session.query(
+                cls,
+                already_attendee.label("already_attendee"),
+                WaitlistEntry.position_of(attendee_id, cls.id).label(
+                    "waitlist_position"
+                ),
+            )
+            .options(
+                joinedload(cls.content),
+                joinedload(cls.location),
+                joinedload(cls.instructor),
+            )
+            .filter(cls.id == masterclass_id)
+            .one_or_none()
+        )
+        return MasterclassProfile(*row) if row else None
+
+    @classmethod
+    def reconcile_booked_counts(cls) -> int:
+        """
+        Recalculates booked_count from the attendee table for every
+        masterclass where it has drifted, in a single UPDATE. Returns the
+        number of masterclasses repaired.
+        """
+        actual_count = (
+            db.select([db.func.count(MasterclassAttendee.id)])
+            .where(MasterclassAttendee.masterclass_id == cls.id)
+            .as_scalar()
+        )
+        repaired = cls.query.filter(cls.booked_count != actual_count).update(
+            {cls.booked_count: actual_count}, synchronize_session=False
+        )
+        db.session.commit()
+        return repaired
+
     def remaining_spaces(self):
-        return self.max_attendees - len(self.attendees)
+        return self.max_attendees - self.booked_count
 
     def set_location_details(self, data, is_remote):
         """
@@ -148,10 +462,84 @@ class Masterclass(db.Model):
         return None
 
 
+# What a masterclass's catalogue card shows, on the masterclass itself and on
+# the rows it points to. Changing any of them bumps Masterclass.version, which
+# cached copies of the card are keyed on.
+CARD_FIELDS = {
+    "Masterclass": (
+        "timestamp",
+        "draft",
+        "is_remote",
+        "masterclass_content_id",
+        "location_id",
+        "instructor_id",
+        "content",
+        "masterclass_content",
+        "location",
+        "instructor",
+    ),
+    "MasterclassContent": ("name",),
+    "Location": ("name", "address"),
+    "User": ("first_name", "last_name"),
+}
+
+# What a masterclass's profile page shows on the rows it points to, on top of
+# the card. Changing any of them moves Masterclass.updated_at, which the
+# profile's ETag is built from.
+PROFILE_FIELDS = {
+    "MasterclassContent": ("name", "description"),
+    "Location": ("name", "address"),
+    "User": ("first_name", "last_name"),
+}
+
+
+def _fields_changed(target, fields: dict) -> bool:
+    state = db.inspect(target)
+    return any(
+        state.attrs[field].history.has_changes()
+        for field in fields[type(target).__name__]
+    )
+
+
+@event.listens_for(Masterclass, "before_update")
+def bump_version_when_card_changes(mapper, connection, target):
+    if _fields_changed(target, CARD_FIELDS):
+        target.version = Masterclass.version + 1
+
+
+@event.listens_for(MasterclassContent, "after_update")
+@event.listens_for(Location, "after_update")
+@event.listens_for(User, "after_update")
+def bump_versions_of_masterclasses_showing(mapper, connection, target):
+    # Any UPDATE of the masterclass moves updated_at, through its onupdate
+    table = Masterclass.__table__
+    if _fields_changed(target, CARD_FIELDS):
+        values = {"version": table.c.version + 1}
+    elif _fields_changed(target, PROFILE_FIELDS):
+        values = {"updated_at": datetime.utcnow()}
+    else:
+        return
+    foreign_key = {
+        MasterclassContent: Masterclass.masterclass_content_id,
+        Location: Masterclass.location_id,
+        User: Masterclass.instructor_id,
+    }[type(target)]
+    connection.execute(table.update().where(foreign_key == target.id).values(values))
+
+
 class MasterclassAttendee(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint(
+            "attendee_id",
+            "masterclass_id",
+            name="uq_masterclass_attendee_attendee_id_masterclass_id",
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     attendee_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-    masterclass_id = db.Column(db.Integer, db.ForeignKey("masterclass.id"))
+    masterclass_id = db.Column(db.Integer, db.ForeignKey("masterclass.id"), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     @staticmethod
     def is_attendee(attendee_id, masterclass_id):
@@ -160,3 +548,143 @@ class MasterclassAttendee(db.Model):
                 masterclass_id=masterclass_id, attendee_id=attendee_id
             ).first()
         )
+
+
+class WaitlistEntry(db.Model):
+    """
+    A user waiting for a place on a full masterclass. Entries are served in
+    id order, so a user's position is how many entries for the masterclass
+    have an id no greater than theirs, and leaving the list never means
+    renumbering the entries behind.
+    """
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "masterclass_id",
+            "attendee_id",
+            name="uq_waitlist_entry_masterclass_id_attendee_id",
+        ),
+        db.Index("ix_waitlist_entry_masterclass_id_id", "masterclass_id", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    masterclass_id = db.Column(
+        db.Integer, db.ForeignKey("masterclass.id"), nullable=False
+    )
+    attendee_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), nullable=False, index=True
+    )
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def position_of(cls, attendee_id, masterclass_id):
+        """
+        Returns a scalar subquery giving the attendee's place in the queue for
+        masterclass_id, an id or a column to correlate with, or 0 if they
+        aren't waiting.
+        """
+        own = aliased(cls)
+        own_entry = (
+            db.select([own.id])
+            .where(
+                and_(
+                    own.masterclass_id == masterclass_id, own.attendee_id == attendee_id
+                )
+            )
+            .as_scalar()
+        )
+        return (
+            db.select([db.func.count(cls.id)])
+            .where(and_(cls.masterclass_id == masterclass_id, cls.id <= own_entry))
+            .as_scalar()
+        )
+
+
+class Job(db.Model):
+    """
+    A piece of background work, such as sending an email, for the worker to
+    run. A job's row is deleted once it succeeds. Jobs that fail on every
+    attempt are kept with failed_at set, so they can be looked at.
+    """
+
+    __table_args__ = (db.Index("ix_job_failed_at_run_at", "failed_at", "run_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    locked_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(64), index=True)
+    failed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class PlaceSearch(db.Model):
+    """A cached Google Places text search, keyed by its normalised query."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    normalised_query = db.Column(db.String, nullable=False, unique=True, index=True)
+    results = db.Column(db.JSON, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    @classmethod
+    def get_fresh_results(
+        cls, normalised_query: str, ttl: timedelta
+    ) -> Union[None, list]:
+        cached = cls.query.filter(
+            cls.normalised_query == normalised_query,
+            cls.fetched_at > datetime.utcnow() - ttl,
+        ).first()
+        return cached.results if cached else None
+
+    @classmethod
+    def store_results(
+        cls, normalised_query: str, results: list, ttl: timedelta, max_rows: int
+    ):
+        """
+        Saves the results of a search, then evicts expired searches and the
+        oldest ones beyond max_rows.
+        """
+        cached = cls.query.filter_by(normalised_query=normalised_query).first()
+        if cached is None:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(
+                        cls(
+                            normalised_query=normalised_query,
+                            results=results,
+                            fetched_at=datetime.utcnow(),
+                        )
+                    )
+            except IntegrityError:
+                # Another request stored the same search in between our check
+                # and insert, so overwrite theirs instead
+                cached = cls.query.filter_by(normalised_query=normalised_query).one()
+        if cached is not None:
+            cached.results = results
+            cached.fetched_at = datetime.utcnow()
+            db.session.flush()
+
+        expired = cls.fetched_at < datetime.utcnow() - ttl
+        oldest_kept = (
+            db.session.query(cls.fetched_at)
+            .order_by(cls.fetched_at.desc())
+            .offset(max_rows - 1)
+            .limit(1)
+            .scalar()
+        )
+        if oldest_kept is not None:
+            expired = or_(expired, cls.fetched_at < oldest_kept)
+        cls.query.filter(expired).delete(synchronize_session=False)
+        db.session.commit()
+        return None
+
+
+class ServerSession(db.Model):
+    """Session data for one browser, looked up by the id in its cookie."""
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
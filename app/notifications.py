@@ -0,0 +1,94 @@
+"""
+Booking emails, sent by the job worker. Signups queue a confirmation, and
+sending the confirmation schedules a reminder for the day before.
+
+Masterclass timestamps are naive local times, while jobs run on naive UTC,
+so timestamps are converted to UTC before being compared with the clock.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Tuple, Union
+
+from flask import render_template
+from sqlalchemy.orm import joinedload
+
+from app.jobs import job_queue
+from app.mail import mailer
+from app.models import Masterclass, MasterclassAttendee, User
+
+BOOKING_CONFIRMATION = "booking_confirmation"
+MASTERCLASS_REMINDER = "masterclass_reminder"
+
+REMINDER_NOTICE = timedelta(days=1)
+
+
+def queue_booking_confirmations(masterclass_id: int, attendee_ids, session=None):
+    """Queues confirmation emails, to be sent once the bookings are committed."""
+    job_queue.enqueue_many(
+        BOOKING_CONFIRMATION,
+        [
+            {"masterclass_id": masterclass_id, "attendee_id": attendee_id}
+            for attendee_id in attendee_ids
+        ],
+        session=session,
+    )
+
+
+def _booking(
+    masterclass_id: int, attendee_id: int
+) -> Union[None, Tuple[Masterclass, User]]:
+    """
+    Returns the masterclass and user if the booking still stands and the
+    masterclass has the name and time an email needs.
+    """
+    if not MasterclassAttendee.is_attendee(attendee_id, masterclass_id):
+        return None
+    masterclass = Masterclass.query.options(
+        joinedload(Masterclass.content), joinedload(Masterclass.location)
+    ).get(masterclass_id)
+    if masterclass.content is None or masterclass.timestamp is None:
+        # Retrying wouldn't help, so the email is dropped rather than failing
+        return None
+    return masterclass, User.query.get(attendee_id)
+
+
+def _utc(local: datetime) -> datetime:
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@job_queue.handler(BOOKING_CONFIRMATION)
+def send_booking_confirmation(masterclass_id: int, attendee_id: int):
+    booking = _booking(masterclass_id, attendee_id)
+    if booking is None:
+        # Cancelled before the worker got to it
+        return
+    masterclass, user = booking
+    mailer.send(
+        user.email,
+        f"You're booked on {masterclass.content.name}",
+        render_template(
+            "emails/booking-confirmation.txt", masterclass=masterclass, user=user
+        ),
+    )
+    remind_at = _utc(masterclass.timestamp) - REMINDER_NOTICE
+    if remind_at > datetime.utcnow():
+        job_queue.enqueue(
+            MASTERCLASS_REMINDER,
+            {"masterclass_id": masterclass_id, "attendee_id": attendee_id},
+            run_at=remind_at,
+        )
+
+
+@job_queue.handler(MASTERCLASS_REMINDER)
+def send_masterclass_reminder(masterclass_id: int, attendee_id: int):
+    booking = _booking(masterclass_id, attendee_id)
+    if booking is None or _utc(booking[0].timestamp) <= datetime.utcnow():
+        return
+    masterclass, user = booking
+    mailer.send(
+        user.email,
+        f"Reminder: {masterclass.content.name} is tomorrow",
+        render_template(
+            "emails/masterclass-reminder.txt", masterclass=masterclass, user=user
+        ),
+    )
@@ -0,0 +1,132 @@
+from collections import Counter
+from datetime import timedelta
+from threading import Lock
+import logging
+import re
+
+import googlemaps
+
+from app.cache import LRUCache
+from app.circuit_breaker import CircuitBreaker
+from app.metrics import PLACES_API_LATENCY, PLACES_SEARCHES
+from app.models import PlaceSearch
+
+
+logger = logging.getLogger(__name__)
+
+MAPS_ERRORS = (
+    googlemaps.exceptions.ApiError,
+    googlemaps.exceptions.HTTPError,
+    googlemaps.exceptions.Timeout,
+    googlemaps.exceptions.TransportError,
+)
+
+
+class PlacesUnavailable(Exception):
+    """
+    Raised when Google Places doesn't answer within its deadline, returns an
+    error or a response we can't use, or isn't being called because the
+    circuit breaker is open.
+    """
+
+
+def normalise_query(query: str) -> str:
+    """
+    Reduces a search to lower case words, so that '102 Petty France' and
+    '102, petty  france' share a cache entry.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+class PlacesSearch:
+    """
+    Google Places text search with two levels of cache in front of it: an
+    in-process LRU cache, then the place_search table shared by every process.
+
+    Calls to Google are bounded by GOOGLE_MAPS_TIMEOUT, and a circuit breaker
+    stops them for a while after repeated failures so that requests don't
+    queue up behind a slow API.
+    """
+
+    max_results = 3
+
+    def __init__(self):
+        self.client = None
+        self.cache = LRUCache()
+        self.ttl = timedelta(0)
+        self.max_rows = 0
+        self.breaker = CircuitBreaker()
+        self.stats = Counter()
+        self._stats_lock = Lock()
+
+    def init_app(self, app):
+        timeout = app.config["GOOGLE_MAPS_TIMEOUT"]
+        self.client = googlemaps.Client(
+            key=app.config["GOOGLE_MAPS_API_KEY"],
+            base_url=app.config["GOOGLE_MAPS_BASE_URL"],
+            timeout=timeout,
+            retry_timeout=timeout,
+            retry_over_query_limit=False,
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=app.config["GOOGLE_MAPS_FAILURE_THRESHOLD"],
+            reset_after=app.config["GOOGLE_MAPS_RESET_AFTER"],
+        )
+        self.ttl = timedelta(seconds=app.config["PLACES_CACHE_TTL"])
+        self.max_rows = app.config["PLACES_CACHE_MAX_ROWS"]
+        self.cache = LRUCache(
+            maxsize=app.config["PLACES_CACHE_SIZE"],
+            ttl=app.config["PLACES_CACHE_TTL"],
+            name="places",
+        )
+
+    def search(self, query: str) -> list:
+        """
+        Returns the top Places results for a query. Raises PlacesUnavailable
+        if they aren't cached and Google can't be used.
+        """
+        key = normalise_query(query)
+        results = self.cache.get(key)
+        if results is not None:
+            self._record("memory_hit")
+            return results
+
+        results = PlaceSearch.get_fresh_results(key, self.ttl)
+        if results is not None:
+            self._record("database_hit")
+        else:
+            self._record("miss")
+            results = self._fetch(query)
+            PlaceSearch.store_results(key, results, self.ttl, self.max_rows)
+        self.cache.set(key, results)
+        return results
+
+    def _fetch(self, query: str) -> list:
+        if not self.breaker.allow_request():
+            self._record("short_circuited")
+            raise PlacesUnavailable("Google Places circuit breaker is open")
+        try:
+            with PLACES_API_LATENCY.time():
+                results = self.client.places(query=query)["results"]
+        except MAPS_ERRORS as error:
+            self.breaker.record_failure()
+            self._record("error")
+            raise PlacesUnavailable(str(error)) from error
+        except Exception as error:
+            # Anything else, such as a malformed response, still counts
+            # against the breaker, and frees the half-open trial for another.
+            # It is logged, but callers only need to handle PlacesUnavailable
+            self.breaker.record_failure()
+            self._record("error")
+            logger.exception("Unexpected error from Google Places")
+            raise PlacesUnavailable(str(error)) from error
+        self.breaker.record_success()
+        return results[0 : self.max_results]
+
+    def _record(self, outcome: str):
+        with self._stats_lock:
+            self.stats[outcome] += 1
+        PLACES_SEARCHES.labels(outcome).inc()
+
+
+places = PlacesSearch()
@@ -1,6 +1,11 @@
+from datetime import datetime
+
 from flask import (
+    abort,
     Blueprint,
+    current_app,
     flash,
+    make_response,
     redirect,
     render_template,
     request,
@@ -14,12 +19,15 @@ from flask_login import current_user, login_user, login_required, logout_user
 from app.models import (
     Location,
     Masterclass,
-    MasterclassAttendee,
     MasterclassContent,
     User,
     db,
 )
-from app import gmaps
+from app.places import PlacesUnavailable, places
+from app.calendars import calendar_feeds
+from app.bookings import BookingOutcome, cancel_booking, join_waitlist, reserve_seat
+from app.database import reads_from_replica
+from app.conditional import add_validators, make_etag, not_modified
 
 main_bp = Blueprint("main_bp", __name__)
 
@@ -27,15 +35,45 @@ main_bp = Blueprint("main_bp", __name__)
 @main_bp.route("/")
 @main_bp.route("/index", methods=["GET"])
 @login_required
+@reads_from_replica
 def index():
-    masterclasses = (
-        Masterclass.query.filter_by(draft=False)
-        .order_by(Masterclass.timestamp.asc())
-        .all()
-    )
-    return render_template(
-        "index.html", title="Home", user=User, masterclasses=masterclasses
+    after = _parse_catalogue_cursor(request.args.get("after"))
+    etag = make_etag(current_user.id, after, *Masterclass.catalogue_version())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    page_size = current_app.config["CATALOGUE_PAGE_SIZE"]
+    masterclasses = Masterclass.upcoming_catalogue(after=after, limit=page_size + 1)
+    next_cursor = None
+    if len(masterclasses) > page_size:
+        masterclasses = masterclasses[:page_size]
+        last = masterclasses[-1]
+        next_cursor = f"{last.timestamp.isoformat()}_{last.id}"
+    response = make_response(
+        render_template(
+            "index.html",
+            title="Home",
+            user=User,
+            masterclasses=masterclasses,
+            next_cursor=next_cursor,
+        )
     )
+    return add_validators(response, etag)
+
+
+def _parse_catalogue_cursor(cursor):
+    """
+    Turns an 'after' cursor from the catalogue's next page link back into the
+    (timestamp, id) of the last masterclass on the previous page.
+    """
+    if cursor is None:
+        return None
+    try:
+        timestamp, id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(timestamp), int(id)
+    except ValueError:
+        abort(400)
 
 
 @main_bp.route("/login", methods=["GET", "POST"])
@@ -51,6 +89,7 @@ def login():
             user,
             # remember=request.form.remember_me.data
         )
+        session.regenerate()
         return redirect(url_for("main_bp.index"))
     return render_template("login.html", title="Sign In")
 
@@ -61,24 +100,67 @@ def logout():
     return redirect(url_for("main_bp.index"))
 
 
-@main_bp.route("/masterclass/<masterclass_id>", methods=["GET", "POST"])
+@main_bp.route("/masterclass/<int:masterclass_id>", methods=["GET", "POST"])
 @login_required
+@reads_from_replica
 def masterclass_profile(masterclass_id):
-    masterclass = Masterclass.query.get(masterclass_id)
-    already_attendee = MasterclassAttendee.is_attendee(current_user.id, masterclass_id)
     if request.method == "POST":
-        new_attendee = MasterclassAttendee(
-            attendee_id=current_user.id, masterclass_id=masterclass_id
+        outcome = reserve_seat(masterclass_id, current_user.id)
+        if outcome is not BookingOutcome.BOOKED:
+            # The profile page tells the user the class is full or already booked
+            return redirect(
+                url_for("main_bp.masterclass_profile", masterclass_id=masterclass_id)
+            )
+        return redirect(
+            url_for("main_bp.signup_confirmation", masterclass_id=masterclass_id)
         )
-        db.session.add(new_attendee)
-        db.session.commit()
+
+    profile = Masterclass.get_profile(masterclass_id, current_user.id)
+    if profile is None:
+        abort(404)
+    masterclass, already_attendee, waitlist_position = profile
+    updated_at = masterclass.updated_at
+    etag = make_etag(
+        current_user.id, masterclass_id, updated_at, already_attendee, waitlist_position
+    )
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    response = make_response(
+        render_template(
+            "masterclass-profile.html",
+            masterclass=masterclass,
+            already_attendee=already_attendee,
+            waitlist_position=waitlist_position,
+        )
+    )
+    return add_validators(response, etag)
+
+
+@main_bp.route("/masterclass/<int:masterclass_id>/waitlist", methods=["POST"])
+@login_required
+def join_masterclass_waitlist(masterclass_id):
+    if Masterclass.query.get(masterclass_id) is None:
+        abort(404)
+    outcome = join_waitlist(masterclass_id, current_user.id)
+    if outcome is BookingOutcome.BOOKED:
         return redirect(
             url_for("main_bp.signup_confirmation", masterclass_id=masterclass_id)
         )
-    return render_template(
-        "masterclass-profile.html",
-        masterclass=masterclass,
-        already_attendee=already_attendee,
+    # The profile page shows the user's place in the queue
+    return redirect(
+        url_for("main_bp.masterclass_profile", masterclass_id=masterclass_id)
+    )
+
+
+@main_bp.route("/masterclass/<int:masterclass_id>/cancel", methods=["POST"])
+@login_required
+def cancel_masterclass_booking(masterclass_id):
+    # Cancelling twice, or without a booking, just shows the profile again
+    cancel_booking(masterclass_id, current_user.id)
+    return redirect(
+        url_for("main_bp.masterclass_profile", masterclass_id=masterclass_id)
     )
 
 
@@ -91,11 +173,84 @@ def signup_confirmation():
 
 @main_bp.route("/my-masterclasses", methods=["GET"])
 @login_required
+@reads_from_replica
 def my_masterclasses():
     user = current_user
-    booked_masterclasses = user.get_booked_masterclasses()
+    etag = make_etag(user.id, *user.bookings_version())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    booked = user.get_upcoming_and_past_masterclasses()
+    response = make_response(
+        render_template(
+            "my-masterclasses.html", upcoming=booked.upcoming, past=booked.past
+        )
+    )
+    return add_validators(response, etag)
+
+
+@main_bp.route("/calendar", methods=["GET", "POST"])
+@login_required
+def calendar():
+    # Posting gives the user feed URLs, or new ones for when the old ones
+    # have leaked. Viewing the page never writes anything.
+    if request.method == "POST":
+        current_user.reset_calendar_token()
+        db.session.commit()
+        return redirect(url_for("main_bp.calendar"))
+    token = current_user.calendar_token
+    if token is None:
+        return render_template("calendar.html")
     return render_template(
-        "my-masterclasses.html", booked_masterclasses=booked_masterclasses
+        "calendar.html",
+        my_masterclasses_url=url_for(
+            "main_bp.my_masterclasses_calendar", token=token, _external=True
+        ),
+        catalogue_url=url_for(
+            "main_bp.catalogue_calendar", token=token, _external=True
+        ),
+    )
+
+
+def _calendar_response(name, version, user, load_masterclasses, attending=False):
+    """
+    Serves a feed with a strong ETag from its version, from the cache
+    unless the version has changed since it was last rendered.
+    """
+    etag = make_etag(name, user.id, request.host_url, *version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    key = (name, user.id if attending else None, request.host_url, tuple(version))
+    feed = calendar_feeds.render(
+        key, name, load_masterclasses, request.host, attending=attending
+    )
+    return add_validators(Response(feed, mimetype="text/calendar"), etag)
+
+
+@main_bp.route("/calendar/<token>/my-masterclasses.ics", methods=["GET"])
+@reads_from_replica
+def my_masterclasses_calendar(token):
+    user = User.query.filter_by(calendar_token=token).first_or_404()
+    return _calendar_response(
+        "My masterclasses",
+        user.bookings_version(),
+        user,
+        user.get_booked_masterclasses,
+        attending=True,
+    )
+
+
+@main_bp.route("/calendar/<token>/catalogue.ics", methods=["GET"])
+@reads_from_replica
+def catalogue_calendar(token):
+    user = User.query.filter_by(calendar_token=token).first_or_404()
+    return _calendar_response(
+        "Upcoming masterclasses",
+        Masterclass.catalogue_version(),
+        user,
+        Masterclass.upcoming_catalogue,
     )
 
 
@@ -227,16 +382,28 @@ def search_for_location():
                 403,
             )
         query = request.form["location"]
-        results = Location.return_existing_location_or_none(query)[0:3]
+        places_unavailable = False
+        results = Location.return_existing_location_or_none(query, limit=3)
         if results:
             results = [location.to_dict() for location in results]
             is_database_data = True
         else:
-            results = gmaps.places(query=query)["results"][0:3]
-            is_database_data = False
+            try:
+                results = places.search(query)
+                is_database_data = False
+            except PlacesUnavailable:
+                results = [
+                    location.to_dict()
+                    for location in Location.return_locations_matching_any_word(
+                        query, limit=3
+                    )
+                ]
+                is_database_data = True
+                places_unavailable = True
 
         session["location_search_results"] = results
         session["location_in_db"] = is_database_data
+        session["places_unavailable"] = places_unavailable
 
         return redirect(url_for("main_bp.location_search_results"))
 
@@ -246,8 +413,9 @@ def search_for_location():
 @main_bp.route("/create-masterclass/location/search/results", methods=["GET", "POST"])
 @login_required
 def location_search_results():
-    results = session["location_search_results"]
-    is_database_data = session["location_in_db"]
+    results = session.get("location_search_results", [])
+    is_database_data = session.get("location_in_db", False)
+    places_unavailable = session.get("places_unavailable", False)
     if request.method == "POST":
         if not request.form.get("select-location"):
             return (
@@ -256,6 +424,7 @@ def location_search_results():
                     validation_error=True,
                     results=results,
                     is_database_data=is_database_data,
+                    places_unavailable=places_unavailable,
                 ),
                 403,
             )
@@ -282,6 +451,7 @@ def location_search_results():
         "create-masterclass/location/search-results.html",
         results=results,
         is_database_data=is_database_data,
+        places_unavailable=places_unavailable,
     )
 
 
@@ -0,0 +1,22 @@
+"""
+Support for running the app under a pre-forking server such as gunicorn,
+which imports the app once in the master and then forks workers from it.
+"""
+
+from app import db
+
+
+def reinitialise_after_fork(app):
+    """
+    Replaces state a worker mustn't share with the master or its siblings:
+    pooled primary and replica connections, and the googlemaps client's HTTP session.
+    Call it in each worker straight after it is forked.
+    """
+    from app.places import places
+
+    with app.app_context():
+        db.get_engine(app).dispose()
+        replica = db.replica_engine(app)
+        if replica is not None:
+            replica.dispose()
+    places.init_app(app)
@@ -0,0 +1,193 @@
+from contextlib import contextmanager
+from datetime import datetime
+from secrets import token_urlsafe
+from threading import Lock
+from typing import Tuple, Union
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import ServerSession
+
+
+class ServerSideSession(SecureCookieSession):
+    """Session data kept on the server, identified by sid in the cookie."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.sid = sid or token_urlsafe(32)
+        self.expires_at = expires_at
+        self.replaced_sid = None
+
+    def regenerate(self):
+        """
+        Moves the data to a new id, deleting the old one when the session is
+        saved, so that an id someone learnt before login is useless after it.
+        """
+        if self.expires_at is not None and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = token_urlsafe(32)
+        self.modified = True
+
+
+class MemorySessionStore:
+    """
+    Keeps sessions in a dict in this process. Only suitable for a single
+    process, such as the development server or tests.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = Lock()
+
+    def load(self, sid: str) -> Union[None, Tuple[str, datetime]]:
+        stored = self._sessions.get(sid)
+        if stored is None or stored[1] <= datetime.utcnow():
+            return None
+        return stored
+
+    def save(self, sid: str, data: str, expires_at: datetime):
+        with self._lock:
+            self._sessions[sid] = (data, expires_at)
+
+    def delete(self, sid: str):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def sweep(self) -> int:
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [
+                sid
+                for sid, (_, expires_at) in self._sessions.items()
+                if expires_at <= now
+            ]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+
+class DatabaseSessionStore:
+    """
+    Keeps sessions in the server_session table, shared by every process.
+
+    Writes go through a session of the store's own, on bind or else the app's
+    engine, so that saving a session never commits whatever a request left
+    uncommitted in db.session.
+    """
+
+    def __init__(self, bind=None):
+        self.bind = bind
+
+    @contextmanager
+    def _transaction(self):
+        session = Session(bind=self.bind or db.engine)
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def load(self, sid: str) -> Union[None, Tuple[str, datetime]]:
+        stored = ServerSession.query.get(sid)
+        if stored is None or stored.expires_at <= datetime.utcnow():
+            return None
+        return stored.data, stored.expires_at
+
+    def save(self, sid: str, data: str, expires_at: datetime):
+        with self._transaction() as session:
+            session.merge(ServerSession(id=sid, data=data, expires_at=expires_at))
+
+    def delete(self, sid: str):
+        with self._transaction() as session:
+            session.query(ServerSession).filter_by(id=sid).delete(
+                synchronize_session=False
+            )
+
+    def sweep(self) -> int:
+        with self._transaction() as session:
+            return (
+                session.query(ServerSession)
+                .filter(ServerSession.expires_at <= datetime.utcnow())
+                .delete(synchronize_session=False)
+            )
+
+
+SESSION_STORES = {"memory": MemorySessionStore, "database": DatabaseSessionStore}
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Stores session data with a SESSION_BACKEND from SESSION_STORES, so the
+    session cookie only carries an opaque random id. Data is loaded once per
+    request and written back only when it has changed, or when it has used up
+    half of its PERMANENT_SESSION_LIFETIME. Expired sessions are swept at most
+    once every SESSION_SWEEP_INTERVAL seconds per process.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, sweep_interval: float = 300):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        stored = self.store.load(sid) if sid else None
+        if stored is None:
+            return ServerSideSession()
+        data, expires_at = stored
+        return ServerSideSession(
+            self.serializer.loads(data), sid=sid, expires_at=expires_at
+        )
+
+    def save_session(self, app, session, response):
+        self._sweep_if_due()
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                if session.expires_at is not None:
+                    self.store.delete(session.replaced_sid or session.sid)
+                response.delete_cookie(
+                    app.session_cookie_name, domain=domain, path=path
+                )
+            return
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        lifetime = app.permanent_session_lifetime
+        now = datetime.utcnow()
+        is_stale = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or is_stale):
+            return
+
+        if session.replaced_sid is not None:
+            self.store.delete(session.replaced_sid)
+        self.store.save(
+            session.sid, self.serializer.dumps(dict(session)), now + lifetime
+        )
+        response.set_cookie(
+            app.session_cookie_name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def _sweep_if_due(self):
+        if time.monotonic() >= self._next_sweep:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            self.store.sweep()
@@ -0,0 +1,85 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from app import db, login
+from app.cache import LRUCache
+from app.models import User
+
+
+class UserCache:
+    """
+    Loads the logged in user for Flask-Login without a query on every request.
+
+    Each user's column values are cached for a short time and turned back into
+    a User attached to the current session without touching the database.
+    Updating or deleting a user drops their entry in this process as soon as
+    the change is committed; other processes see it once their entry expires.
+    """
+
+    def __init__(self):
+        self.cache = LRUCache()
+
+    def init_app(self, app):
+        self.cache = LRUCache(
+            maxsize=app.config["USER_CACHE_SIZE"],
+            ttl=app.config["USER_CACHE_TTL"],
+            name="users",
+        )
+        login.user_loader(self.load)
+
+    def load(self, id) -> User:
+        id = int(id)
+        columns = self.cache.get(id)
+        if columns is None:
+            user = User.query.get(id)
+            if user is not None:
+                self.cache.set(id, self._columns(user))
+            return user
+        user = User(**columns)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, id):
+        self.cache.invalidate(id)
+
+    def stats(self) -> dict:
+        lookups = self.cache.hits + self.cache.misses
+        return {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "size": len(self.cache),
+            "hit_rate": self.cache.hits / lookups if lookups else 0.0,
+        }
+
+    @staticmethod
+    def _columns(user) -> dict:
+        return {
+            column.key: getattr(user, column.key)
+            for column in User.__mapper__.column_attrs
+        }
+
+
+user_cache = UserCache()
+
+
+# Users are only forgotten once their changes are committed. Forgetting them
+# at flush time would let another request cache the old, still committed
+# values again before this transaction commits.
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def note_changed_user(mapper, connection, target):
+    session = object_session(target)
+    session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def forget_changed_users(session):
+    for id in session.info.pop("changed_user_ids", ()):
+        user_cache.invalidate(id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def keep_unchanged_users(session, previous_transaction):
+    # A rolled back savepoint may leave earlier changes still to be committed
+    if previous_transaction.parent is None:
+        session.info.pop("changed_user_ids", None)
@@ -0,0 +1,83 @@
+"""
+Measures `flask import-data` throughput for each kind of row.
+
+    python -m benchmarks.bulk_import --rows 100000
+
+Runs against a throwaway SQLite database unless --database-url is given.
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+from app import create_app, db, importer
+from config import Config
+
+
+def write_files(directory, rows):
+    paths = {kind: os.path.join(directory, f"{kind}.csv") for kind in importer_kinds()}
+    with open(paths["users"], "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["email", "first_name", "last_name"])
+        for i in range(rows):
+            writer.writerow([f"user{i}@example.com", f"First{i}", f"Last{i}"])
+    with open(paths["content"], "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "description", "category"])
+        for i in range(rows):
+            writer.writerow([f"Masterclass {i}", "A description", "Data"])
+    with open(paths["masterclasses"], "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(
+            ["timestamp", "max_attendees", "masterclass_content_id", "instructor_email"]
+        )
+        for i in range(rows):
+            writer.writerow(
+                ["2030-01-01T09:30", 20, i % rows + 1, f"user{i % rows}@example.com"]
+            )
+    return paths
+
+
+def importer_kinds():
+    return ["users", "content", "masterclasses"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        directory, "benchmark.db"
+    )
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+
+    app = create_app(BenchmarkConfig)
+    paths = write_files(directory, args.rows)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f"{args.rows} rows per file, batches of {args.batch_size}")
+        print(f"{'kind':<16}{'validate (rows/s)':>20}{'import (rows/s)':>18}")
+        for kind in importer_kinds():
+            start = time.perf_counter()
+            importer.validate_file(kind, paths[kind], args.batch_size)
+            validated = time.perf_counter() - start
+
+            start = time.perf_counter()
+            imported = importer.import_file(kind, paths[kind], args.batch_size)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{kind:<16}{args.rows / validated:>20.0f}{imported / elapsed:>18.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
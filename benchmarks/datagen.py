@@ -0,0 +1,226 @@
+"""
+Fills a database with seeded, synthetic users, content, locations,
+masterclasses and bookings, so the routes can be measured at realistic sizes.
+
+    python -m benchmarks.datagen --database-url sqlite:////tmp/bench.db --scale 10
+
+--scale multiplies every table's base size; scale 1 books around 55,000
+seats and scale 50 over two and a half million. The same seed always produces the same
+rows, relative to the day they're generated on. User 1, BENCHMARK_EMAIL, is
+booked onto HEAVY_USER_BOOKINGS masterclasses.
+
+Every table is dropped first, so only an empty SQLite database is filled
+unless --force is given.
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import random
+import time
+
+from sqlalchemy import inspect
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+from app.models import (
+    Location,
+    Masterclass,
+    MasterclassAttendee,
+    MasterclassContent,
+    User,
+)
+from benchmarks.location_search import make_locations
+from config import Config
+
+BENCHMARK_EMAIL = "benchmark@example.com"
+BENCHMARK_PASSWORD = "benchmark"
+HEAVY_USER_BOOKINGS = 200
+BASE_SIZES = {
+    "users": 5000,
+    "content": 200,
+    "locations": 500,
+    "masterclasses": 2000,
+}
+CATEGORIES = [
+    "Architecture",
+    "Chief Data Officer",
+    "Data",
+    "Delivery",
+    "IT Operations",
+    "Product and Delivery",
+    "Quality Assurance Testing (QAT)",
+    "Technical",
+    "User Centred Design",
+]
+CHUNK_SIZE = 10000
+
+
+def sizes_for(scale: float) -> dict:
+    return {table: max(1, int(size * scale)) for table, size in BASE_SIZES.items()}
+
+
+def _insert(model, rows):
+    """Inserts rows, an iterable of dicts, with executemany in chunks."""
+    table = model.__table__
+    chunk = []
+    count = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        count += len(chunk)
+    db.session.commit()
+    return count
+
+
+def _users(count):
+    # Hashing is deliberately slow, so every user shares one password
+    password_hash = generate_password_hash(BENCHMARK_PASSWORD)
+    yield {
+        "id": 1,
+        "email": BENCHMARK_EMAIL,
+        "first_name": "Benchmark",
+        "last_name": "User",
+        "password_hash": password_hash,
+        "draft": False,
+    }
+    for i in range(2, count + 1):
+        yield {
+            "id": i,
+            "email": f"user{i}@example.com",
+            "first_name": f"First{i}",
+            "last_name": f"Last{i}",
+            "password_hash": password_hash,
+            "draft": False,
+        }
+
+
+def _content(rng, count):
+    for i in range(1, count + 1):
+        yield {
+            "id": i,
+            "name": f"Masterclass {i}",
+            "description": "An introduction to a topic, with time for questions.",
+            "category": rng.choice(CATEGORIES),
+        }
+
+
+def _masterclasses(rng, sizes, now):
+    for i in range(1, sizes["masterclasses"] + 1):
+        is_remote = rng.random() < 0.3
+        yield {
+            "id": i,
+            "timestamp": now + timedelta(hours=rng.randint(-24 * 180, 24 * 365)),
+            "max_attendees": rng.randint(10, 100),
+            "is_remote": is_remote,
+            "remote_url": "https://meet.example.com/room" if is_remote else None,
+            "room": None if is_remote else f"{rng.randint(1, 9)}{rng.choice('ABCD')}",
+            "floor": None if is_remote else str(rng.randint(0, 9)),
+            "masterclass_content_id": rng.randint(1, sizes["content"]),
+            "location_id": None if is_remote else rng.randint(1, sizes["locations"]),
+            "instructor_id": rng.randint(2, sizes["users"]),
+            "draft": rng.random() < 0.05,
+            "version": 1,
+            "updated_at": now,
+        }
+
+
+def _bookings(rng, masterclasses, users, fill, now):
+    """
+    Books each masterclass to about `fill` of its capacity with distinct
+    attendees, putting user 1 on the first HEAVY_USER_BOOKINGS of them.
+    """
+    for index, masterclass in enumerate(masterclasses):
+        capacity = min(masterclass["max_attendees"], users - 1)
+        booked = min(capacity, int(capacity * fill + rng.random()))
+        heavy_user = index < HEAVY_USER_BOOKINGS and booked > 0
+        attendees = rng.sample(range(2, users + 1), booked - heavy_user)
+        if heavy_user:
+            attendees.append(1)
+        for attendee_id in attendees:
+            yield {
+                "attendee_id": attendee_id,
+                "masterclass_id": masterclass["id"],
+                "created_at": now,
+            }
+
+
+def check_database_is_scratch():
+    """
+    Raises RuntimeError unless the database is SQLite with no tables yet, as
+    generating data drops every table first.
+    """
+    if db.engine.dialect.name != "sqlite":
+        raise RuntimeError(
+            f"Refusing to replace a {db.engine.dialect.name} database, "
+            "pass --force to do so anyway"
+        )
+    if inspect(db.engine).get_table_names():
+        raise RuntimeError(
+            f"Refusing to replace {db.engine.url.database}, which already has "
+            "tables, pass --force to do so anyway"
+        )
+
+
+def generate(
+    scale: float = 1, fill: float = 0.5, seed: int = 0, force: bool = False
+) -> dict:
+    """
+    Creates the tables and fills them. Returns how many rows went into each.
+    Only an empty SQLite database is replaced unless force is set.
+    """
+    if not force:
+        check_database_is_scratch()
+    rng = random.Random(seed)
+    sizes = sizes_for(scale)
+    now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    db.drop_all()
+    db.create_all()
+    counts = {
+        "users": _insert(User, _users(sizes["users"])),
+        "content": _insert(MasterclassContent, _content(rng, sizes["content"])),
+        "locations": _insert(Location, make_locations(sizes["locations"], seed=seed)),
+    }
+    masterclasses = list(_masterclasses(rng, sizes, now))
+    counts["masterclasses"] = _insert(Masterclass, masterclasses)
+    counts["bookings"] = _insert(
+        MasterclassAttendee,
+        _bookings(rng, masterclasses, sizes["users"], fill, now),
+    )
+    Masterclass.reconcile_booked_counts()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--fill", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Replace the database even if it isn't an empty SQLite one.",
+    )
+    args = parser.parse_args()
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        start = time.perf_counter()
+        counts = generate(args.scale, args.fill, args.seed, force=args.force)
+        elapsed = time.perf_counter() - start
+    for table, count in counts.items():
+        print(f"{table:<16}{count:>12}")
+    print(f"generated in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Compares the indexed location search with the ILIKE scan it replaced.
+
+    python -m benchmarks.location_search --rows 100000
+
+Runs against a throwaway SQLite database unless --database-url is given.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app import create_app, db
+from app.models import Location
+from config import Config
+
+STREETS = [
+    "Petty France",
+    "Marsham Street",
+    "Whitehall",
+    "Victoria Street",
+    "The Strand",
+    "Holborn",
+    "Canary Wharf",
+    "Bute Street",
+]
+TOWNS = [
+    "London",
+    "Manchester",
+    "Leeds",
+    "Bristol",
+    "Newport",
+    "Glasgow",
+    "Cardiff",
+    "Sheffield",
+]
+QUERIES = [
+    "102 Petty France",
+    "petty",
+    "SW1H 9AJ",
+    "Marsham",
+    "Leeds LS1",
+    "no such place",
+]
+
+
+def make_locations(rows, seed=0):
+    rng = random.Random(seed)
+    for i in range(1, rows + 1):
+        street = rng.choice(STREETS)
+        town = rng.choice(TOWNS)
+        postcode = "{} {}{}".format(
+            rng.choice(["SW1H", "SW1P", "LS1", "M1", "BS1", "NP10", "G2", "CF10"]),
+            rng.randint(1, 9),
+            "".join(rng.choice("ABDEFGHJLNPQRSTUWXYZ") for _ in range(2)),
+        )
+        yield {
+            "id": i,
+            "name": f"{rng.randint(1, 300)} {street}",
+            "address": f"{rng.randint(1, 300)} {street}, {town} {postcode}",
+        }
+
+
+def time_query(search, query, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        search(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(), "benchmark.db"
+    )
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        batch = []
+        for row in make_locations(args.rows):
+            batch.append(row)
+            if len(batch) == 10000:
+                db.session.bulk_insert_mappings(Location, batch)
+                batch = []
+        db.session.bulk_insert_mappings(Location, batch)
+        db.session.commit()
+
+        def indexed(query):
+            return Location.return_existing_location_or_none(query, limit=3)
+
+        def scan(query):
+            return Location._search_ilike([query]).limit(3).all()
+
+        print(f"{args.rows} locations, median of {args.repeats} runs")
+        print(f"{'query':<20}{'ILIKE scan (ms)':>18}{'indexed (ms)':>16}")
+        for query in QUERIES:
+            print(
+                f"{query:<20}"
+                f"{time_query(scan, query, args.repeats):>18.2f}"
+                f"{time_query(indexed, query, args.repeats):>16.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
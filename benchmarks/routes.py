@@ -0,0 +1,241 @@
+"""
+Drives the busiest routes through the Flask test client against generated
+data, and writes each route's latency percentiles and queries per request to
+a JSON file.
+
+    python -m benchmarks.routes --scale 10 --output before.json
+    python -m benchmarks.routes --scale 10 --output after.json --compare before.json
+
+Data is generated with benchmarks.datagen into a throwaway SQLite database
+unless --database-url is given; pass --reuse to measure an already generated
+database as it stands. The signup scenario books seats, so reused databases
+drift between runs. Generating data into anything but an empty SQLite
+database needs --force, as every table is dropped first.
+"""
+
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Location, Masterclass
+from benchmarks import datagen
+from config import Config
+
+
+def _upcoming_ids():
+    return [
+        id
+        for id, in Masterclass.query.with_entities(Masterclass.id)
+        .filter_by(draft=False)
+        .filter(Masterclass.timestamp > datetime.now())
+        .order_by(Masterclass.id)
+    ]
+
+
+def scenarios(rng):
+    """
+    Returns (name, request) pairs, where request takes the logged in test
+    client and makes one request, returning the response.
+    """
+    upcoming = _upcoming_ids()
+    location_names = [name for name, in Location.query.with_entities(Location.name)]
+    signup_ids = rng.sample(upcoming, len(upcoming))
+
+    def index(client):
+        return client.get("/")
+
+    def masterclass_profile(client):
+        return client.get(f"/masterclass/{rng.choice(upcoming)}")
+
+    def my_masterclasses(client):
+        return client.get("/my-masterclasses")
+
+    def signup(client):
+        masterclass_id = signup_ids.pop() if signup_ids else rng.choice(upcoming)
+        return client.post(f"/masterclass/{masterclass_id}")
+
+    def location_search(client):
+        return client.post(
+            "/create-masterclass/location/search",
+            data={"location": rng.choice(location_names)},
+        )
+
+    return [
+        ("index", index),
+        ("masterclass_profile", masterclass_profile),
+        ("my_masterclasses", my_masterclasses),
+        ("signup", signup),
+        ("location_search", location_search),
+    ]
+
+
+def measure(client, request, requests, warmup):
+    """
+    Makes warmup unmeasured requests, then `requests` measured ones, and
+    returns their latency percentiles in milliseconds and query counts.
+    """
+    for _ in range(warmup):
+        request(client)
+
+    queries = []
+    timings = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        queries[-1] += 1
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        for _ in range(requests):
+            queries.append(0)
+            start = time.perf_counter()
+            response = request(client)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{response.status_code} from {request.__name__}")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    timings.sort()
+    return {
+        "requests": requests,
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p90_ms": round(_percentile(timings, 90), 3),
+        "p99_ms": round(_percentile(timings, 99), 3),
+        "max_ms": round(max(timings), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "queries_per_request": round(statistics.mean(queries), 2),
+        "max_queries": max(queries),
+    }
+
+
+def _percentile(ordered: list, percent: float) -> float:
+    """
+    Interpolates between the closest ranks of sorted samples, as
+    statistics.quantiles(method="inclusive") does on Python 3.8 and later.
+    """
+    position = (len(ordered) - 1) * percent / 100
+    below = int(position)
+    above = min(below + 1, len(ordered) - 1)
+    return ordered[below] + (ordered[above] - ordered[below]) * (position - below)
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as file:
+        baseline = json.load(file)["routes"]
+    print(f"\ncompared with {baseline_path}")
+    print(f"{'route':<22}{'p50 before':>12}{'p50 after':>12}{'change':>10}")
+    for route, after in results.items():
+        before = baseline.get(route)
+        if before is None:
+            continue
+        change = (after["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100
+        print(
+            f"{route:<22}{before['p50_ms']:>12.2f}{after['p50_ms']:>12.2f}"
+            f"{change:>+9.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url")
+    parser.add_argument("--reuse", action="store_true")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Replace --database-url even if it isn't an empty SQLite database.",
+    )
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--fill", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(), "benchmark.db"
+    )
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        # Searches that miss the database must not reach the real Places API
+        GOOGLE_MAPS_BASE_URL = "http://127.0.0.1:9"
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        database = db.engine.dialect.name
+        if args.reuse:
+            counts = None
+        else:
+            counts = datagen.generate(
+                args.scale, args.fill, args.seed, force=args.force
+            )
+
+        client = app.test_client()
+        response = client.post(
+            "/login",
+            data={
+                "email-address": datagen.BENCHMARK_EMAIL,
+                "password": datagen.BENCHMARK_PASSWORD,
+            },
+        )
+        if response.status_code != 302:
+            raise RuntimeError("Couldn't log in as the benchmark user")
+
+        rng = random.Random(args.seed)
+        results = {}
+        print(f"{'route':<22}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'queries':>10}")
+        for name, request in scenarios(rng):
+            results[name] = measure(client, request, args.requests, args.warmup)
+            print(
+                f"{name:<22}{results[name]['p50_ms']:>10.2f}"
+                f"{results[name]['p90_ms']:>10.2f}{results[name]['p99_ms']:>10.2f}"
+                f"{results[name]['queries_per_request']:>10.1f}"
+            )
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "commit": _commit(),
+                "run_at": datetime.utcnow().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "database": database,
+                "scale": args.scale,
+                "seed": args.seed,
+                "rows": counts,
+                "routes": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"\nwrote {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,51 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+    DATABASE_POOL_PRE_PING = os.environ.get('DATABASE_POOL_PRE_PING', '1') == '1'
+    RELEASE = os.environ.get('RELEASE') or ''
+    CATALOGUE_PAGE_SIZE = int(os.environ.get('CATALOGUE_PAGE_SIZE', 20))
+    CARD_CACHE_SIZE = int(os.environ.get('CARD_CACHE_SIZE', 2048))
+    GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY') or 'AIza_KEY_HERE'
+    GOOGLE_MAPS_BASE_URL = os.environ.get('GOOGLE_MAPS_BASE_URL') or 'https://maps.googleapis.com'
+    GOOGLE_MAPS_TIMEOUT = float(os.environ.get('GOOGLE_MAPS_TIMEOUT', 2))
+    GOOGLE_MAPS_FAILURE_THRESHOLD = int(os.environ.get('GOOGLE_MAPS_FAILURE_THRESHOLD', 5))
+    GOOGLE_MAPS_RESET_AFTER = float(os.environ.get('GOOGLE_MAPS_RESET_AFTER', 30))
+    PLACES_CACHE_SIZE = int(os.environ.get('PLACES_CACHE_SIZE', 512))
+    PLACES_CACHE_TTL = int(os.environ.get('PLACES_CACHE_TTL', 60 * 60 * 24 * 7))
+    PLACES_CACHE_MAX_ROWS = int(os.environ.get('PLACES_CACHE_MAX_ROWS', 10000))
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    CALENDAR_CACHE_SIZE = int(os.environ.get('CALENDAR_CACHE_SIZE', 1024))
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION') == '1'
+    SQL_SLOWEST_STATEMENTS = int(os.environ.get('SQL_SLOWEST_STATEMENTS', 3))
+    SQL_QUERY_BUDGET = int(os.environ['SQL_QUERY_BUDGET']) if 'SQL_QUERY_BUDGET' in os.environ else None
+    SQL_QUERY_BUDGET_STRICT = os.environ.get('SQL_QUERY_BUDGET_STRICT') == '1'
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or 'database'
+    SESSION_SWEEP_INTERVAL = int(os.environ.get('SESSION_SWEEP_INTERVAL', 300))
+    MAIL_BACKEND = os.environ.get('MAIL_BACKEND') or 'smtp'
+    MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'localhost'
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 1025))
+    MAIL_TIMEOUT = float(os.environ.get('MAIL_TIMEOUT', 10))
+    MAIL_FILE_DIR = os.environ.get('MAIL_FILE_DIR') or os.path.join(basedir, 'outbox')
+    MAIL_SENDER = os.environ.get('MAIL_SENDER') or 'masterclasses@example.com'
+    JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', 20))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_SECONDS = int(os.environ.get('JOB_RETRY_SECONDS', 30))
+    JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 5))
+    JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', 600))
 
 
 class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
     LOGIN_DISABLED = False
+    SQL_INSTRUMENTATION = True
+    SQL_QUERY_BUDGET = 10
+    SQL_QUERY_BUDGET_STRICT = True
+    MAIL_BACKEND = 'file'
@@ -0,0 +1,40 @@
+"""
+Gunicorn settings for serving the app in production:
+
+    gunicorn --config gunicorn.conf.py masterclasses:app
+
+The app is imported once in the master and forked into WEB_CONCURRENCY
+workers of GUNICORN_THREADS threads each. Send the master HUP to replace
+workers gracefully with the same code; as the app is preloaded, new code
+needs a new master, started with USR2 and followed by WINCH and QUIT to the
+old one.
+"""
+
+import multiprocessing
+import os
+
+bind = "0.0.0.0:" + os.environ.get("PORT", "5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = True
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Recycle workers now and then, staggered so they don't all restart at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    from app.serving import reinitialise_after_fork
+
+    reinitialise_after_fork(server.app.wsgi())
+
+
+def child_exit(server, worker):
+    if "prometheus_multiproc_dir" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
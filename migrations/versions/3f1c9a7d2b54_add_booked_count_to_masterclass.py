@@ -0,0 +1,29 @@
+"""Add booked_count to masterclass
+
+Revision ID: 3f1c9a7d2b54
+Revises: 86193db96139
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b54'
+down_revision = '86193db96139'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('masterclass', sa.Column('booked_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE masterclass SET booked_count = ('
+        'SELECT count(masterclass_attendee.id) FROM masterclass_attendee '
+        'WHERE masterclass_attendee.masterclass_id = masterclass.id)'
+    )
+
+
+def downgrade():
+    op.drop_column('masterclass', 'booked_count')
@@ -0,0 +1,36 @@
+"""Allow only one booking per attendee per masterclass
+
+Revision ID: 9a4e6c21f7d3
+Revises: 3f1c9a7d2b54
+Create Date: 2026-10-18 10:02:17.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4e6c21f7d3'
+down_revision = '3f1c9a7d2b54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Remove double bookings made before the constraint existed, keeping the
+    # earliest, and bring booked_count back in line with what's left
+    op.execute(
+        'DELETE FROM masterclass_attendee WHERE id NOT IN ('
+        'SELECT min(id) FROM masterclass_attendee '
+        'GROUP BY attendee_id, masterclass_id)'
+    )
+    op.execute(
+        'UPDATE masterclass SET booked_count = ('
+        'SELECT count(masterclass_attendee.id) FROM masterclass_attendee '
+        'WHERE masterclass_attendee.masterclass_id = masterclass.id)'
+    )
+    op.create_unique_constraint('uq_masterclass_attendee_attendee_id_masterclass_id', 'masterclass_attendee', ['attendee_id', 'masterclass_id'])
+
+
+def downgrade():
+    op.drop_constraint('uq_masterclass_attendee_attendee_id_masterclass_id', 'masterclass_attendee', type_='unique')
@@ -0,0 +1,60 @@
+"""Add trigram search index over location name and address
+
+Revision ID: c81d2f0e5a96
+Revises: 9a4e6c21f7d3
+Create Date: 2026-10-18 11:26:53.072418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81d2f0e5a96'
+down_revision = '9a4e6c21f7d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_location_name_trgm', 'location', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_location_address_trgm', 'location', ['address'], unique=False, postgresql_using='gin', postgresql_ops={'address': 'gin_trgm_ops'})
+    elif dialect == 'sqlite' and op.get_bind().dialect.dbapi.sqlite_version_info >= (3, 34, 0):
+        # Older SQLite has no trigram tokenizer, so searches scan location
+        op.execute(
+            "CREATE VIRTUAL TABLE location_search USING fts5("
+            "name, address, content='location', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            "CREATE TRIGGER location_search_ai AFTER INSERT ON location BEGIN "
+            "INSERT INTO location_search(rowid, name, address) "
+            "VALUES (new.id, new.name, new.address); END"
+        )
+        op.execute(
+            "CREATE TRIGGER location_search_ad AFTER DELETE ON location BEGIN "
+            "INSERT INTO location_search(location_search, rowid, name, address) "
+            "VALUES ('delete', old.id, old.name, old.address); END"
+        )
+        op.execute(
+            "CREATE TRIGGER location_search_au AFTER UPDATE ON location BEGIN "
+            "INSERT INTO location_search(location_search, rowid, name, address) "
+            "VALUES ('delete', old.id, old.name, old.address); "
+            "INSERT INTO location_search(rowid, name, address) "
+            "VALUES (new.id, new.name, new.address); END"
+        )
+        op.execute("INSERT INTO location_search(location_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_location_address_trgm', table_name='location')
+        op.drop_index('ix_location_name_trgm', table_name='location')
+    elif dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS location_search_au')
+        op.execute('DROP TRIGGER IF EXISTS location_search_ad')
+        op.execute('DROP TRIGGER IF EXISTS location_search_ai')
+        op.execute('DROP TABLE IF EXISTS location_search')
@@ -1,4 +1,11 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import json
+import time
+
 from flask import url_for
+from sqlalchemy import event
 
 from app import create_app
 from app import db as _db
@@ -35,7 +42,7 @@ def logged_in_user(test_client, db, test_user):
     with test_client:
         test_client.post(
             url_for("main_bp.login"),
-            data={"email-address": "test@user.com", "password": "password"}
+            data={"email-address": "test@example.com", "password": "password"}
         )
         yield test_client
         test_client.get("main_bp.logout")
@@ -63,16 +70,35 @@ def blank_session(db):
     session_ = db.create_scoped_session(options=options)
 
     db.session = session_
+    # Sessions are saved through their own session, which has to join this one
+    store = db.get_app().session_interface.store
+    store.bind = connection
 
     print("Yielding blank session")
     yield session_
 
+    store.bind = None
     transaction.rollback()
     connection.close()
     session_.remove()
     print("Rolled back blank session")
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """
+    Ids are reused between tests as each one's data is rolled back, so
+    in-process caches keyed on them are emptied before every test.
+    """
+    from app.calendars import calendar_feeds
+    from app.fragments import masterclass_cards
+    from app.users import user_cache
+
+    calendar_feeds.cache.clear()
+    masterclass_cards.cache.clear()
+    user_cache.cache.clear()
+
+
 @pytest.fixture
 def test_user(db, blank_session):
     u = User(email='test@example.com')
@@ -88,3 +114,111 @@ def test_masterclass(db, blank_session):
     db.session.add(m)
     db.session.commit()
     yield m
+
+
+@pytest.fixture
+def count_queries(db):
+    """
+    Returns a context manager which records every SQL statement executed
+    against the test database while it is active, along with its parameters
+    if with_parameters is set.
+    """
+
+    @contextmanager
+    def _count_queries(with_parameters=False):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters) if with_parameters else statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+    return _count_queries
+
+
+class FakeGmapsClient:
+    """Stands in for googlemaps.Client, recording the searches made."""
+
+    def __init__(self, results=None):
+        self.results = results or []
+        self.queries = []
+
+    def places(self, query):
+        self.queries.append(query)
+        return {"results": self.results, "status": "OK"}
+
+
+@pytest.fixture
+def fake_gmaps(blank_session):
+    """
+    Replaces the Google Maps client with a FakeGmapsClient and starts from an
+    empty places cache.
+    """
+    from app.places import places
+
+    real_client = places.client
+    places.client = FakeGmapsClient(
+        [{"place_id": "123", "name": "A place", "formatted_address": "An address"}]
+    )
+    places.cache.clear()
+    places.stats.clear()
+    yield places.client
+    places.client = real_client
+    places.cache.clear()
+
+
+class FakeMapsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        body = json.dumps({"status": self.server.status, "results": []}).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up waiting
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_maps_server(blank_session):
+    """
+    Runs a local stand-in for the Maps API and points the places search at it,
+    with a short deadline and a circuit breaker that opens after two failures.
+    Set `delay` on the server to slow it down, or `status` to an error status.
+    """
+    import googlemaps
+    from app.circuit_breaker import CircuitBreaker
+    from app.places import places
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMapsHandler)
+    server.daemon_threads = True
+    server.requests = 0
+    server.delay = 0
+    server.status = "OK"
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    real_client, real_breaker = places.client, places.breaker
+    places.client = googlemaps.Client(
+        key="AIza_KEY_HERE",
+        base_url=f"http://127.0.0.1:{server.server_port}",
+        timeout=0.2,
+        retry_timeout=0.2,
+        retry_over_query_limit=False,
+    )
+    places.breaker = CircuitBreaker(failure_threshold=2, reset_after=60)
+    places.cache.clear()
+    yield server
+    places.client, places.breaker = real_client, real_breaker
+    places.cache.clear()
+    server.shutdown()
+    server.server_close()
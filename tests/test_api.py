@@ -0,0 +1,62 @@
+from datetime import datetime
+import json
+
+import pytest
+
+from app.models import Location, Masterclass, MasterclassContent
+
+
+def _records(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.fixture
+def test_locations(db, blank_session):
+    locations = [Location(id=i, name=f"Building {i}", address=f"{i} Road") for i in range(1, 6)]
+    db.session.add_all(locations)
+    db.session.commit()
+    yield locations
+
+
+def test_locations_are_streamed_as_ndjson(logged_in_user, test_locations):
+    response = logged_in_user.get("/api/locations?fields=id,name")
+    assert response.mimetype == "application/x-ndjson"
+    assert _records(response) == [{"id": i, "name": f"Building {i}"} for i in range(1, 6)]
+
+
+def test_locations_are_paged_by_cursor(logged_in_user, test_locations):
+    first_page = _records(logged_in_user.get("/api/locations?fields=id&limit=2"))
+    second_page = _records(
+        logged_in_user.get(f"/api/locations?fields=id&limit=2&after={first_page[-1]['id']}")
+    )
+    assert first_page == [{"id": 1}, {"id": 2}]
+    assert second_page == [{"id": 3}, {"id": 4}]
+
+
+def test_only_published_masterclasses_are_exported(logged_in_user, db, blank_session):
+    db.session.add_all(
+        [
+            MasterclassContent(id=1, name="Introduction to R"),
+            Masterclass(id=1, draft=False, masterclass_content_id=1, timestamp=datetime(2030, 1, 1, 9)),
+            Masterclass(id=2, draft=True, masterclass_content_id=1),
+        ]
+    )
+    db.session.commit()
+    response = logged_in_user.get("/api/masterclasses?fields=id,name,timestamp")
+    assert _records(response) == [
+        {"id": 1, "name": "Introduction to R", "timestamp": "2030-01-01T09:00:00"}
+    ]
+
+
+@pytest.mark.parametrize("fields", ("remote_url", "id,", ""))
+def test_unknown_fields_are_rejected(logged_in_user, fields):
+    assert logged_in_user.get(f"/api/masterclasses?fields={fields}").status_code == 400
+
+
+@pytest.mark.parametrize("arguments", ("limit=-1", "limit=ten", "after=1.5", "after="))
+def test_malformed_paging_arguments_are_rejected(logged_in_user, arguments):
+    assert logged_in_user.get(f"/api/locations?{arguments}").status_code == 400
+
+
+def test_api_requires_login(test_client, blank_session):
+    assert test_client.get("/api/locations").status_code == 302
@@ -0,0 +1,170 @@
+"""
+Concurrent signup and cancellation tests for the booking service. These run
+against their own file-backed databases rather than the shared in-memory test
+database, so that each thread gets a real connection of its own.
+
+Set POSTGRES_TEST_URL to also run them against a Postgres database.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import db as _db
+from app.bookings import (
+    BookingOutcome,
+    cancel_booking,
+    promote_from_waitlist,
+    reserve_seat,
+)
+from app.models import Masterclass, MasterclassAttendee, User, WaitlistEntry
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def engine(request, tmp_path):
+    if request.param == "sqlite":
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'bookings.db'}", connect_args={"timeout": 30}
+        )
+    else:
+        url = os.environ.get("POSTGRES_TEST_URL")
+        if not url:
+            pytest.skip("POSTGRES_TEST_URL is not set")
+        engine = create_engine(url, pool_size=20)
+    _db.metadata.create_all(engine)
+    yield engine
+    _db.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine)
+
+
+def _set_up_masterclass(session_factory, max_attendees, number_of_users):
+    session = session_factory()
+    session.add_all(
+        [User(id=i, email=f"user{i}@example.com") for i in range(1, number_of_users + 1)]
+    )
+    session.add(Masterclass(id=1, max_attendees=max_attendees))
+    session.commit()
+    session.close()
+
+
+def _run_concurrently(session_factory, calls):
+    """Runs each call with its own session, all starting at once."""
+    start = Barrier(len(calls))
+
+    def run(call):
+        session = session_factory()
+        try:
+            start.wait()
+            return call(session)
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return list(pool.map(run, calls))
+
+
+def _sign_up_concurrently(session_factory, attendee_ids):
+    return _run_concurrently(
+        session_factory,
+        [
+            lambda session, attendee_id=attendee_id: reserve_seat(
+                1, attendee_id, session=session
+            )
+            for attendee_id in attendee_ids
+        ],
+    )
+
+
+def _booked_count_and_attendees(session_factory):
+    session = session_factory()
+    booked_count = session.query(Masterclass).get(1).booked_count
+    attendees = session.query(MasterclassAttendee).filter_by(masterclass_id=1).count()
+    session.close()
+    return booked_count, attendees
+
+
+def test_concurrent_signups_do_not_oversell(session_factory):
+    _set_up_masterclass(session_factory, max_attendees=10, number_of_users=40)
+
+    outcomes = _sign_up_concurrently(session_factory, range(1, 41))
+
+    assert outcomes.count(BookingOutcome.BOOKED) == 10
+    assert outcomes.count(BookingOutcome.FULL) == 30
+    assert _booked_count_and_attendees(session_factory) == (10, 10)
+
+
+def test_concurrent_signups_by_one_user_do_not_double_book(session_factory):
+    _set_up_masterclass(session_factory, max_attendees=10, number_of_users=1)
+
+    outcomes = _sign_up_concurrently(session_factory, [1] * 20)
+
+    assert outcomes.count(BookingOutcome.BOOKED) == 1
+    assert outcomes.count(BookingOutcome.ALREADY_BOOKED) == 19
+    assert _booked_count_and_attendees(session_factory) == (1, 1)
+
+
+def test_concurrent_promotions_and_signups_do_not_oversell(session_factory):
+    _set_up_masterclass(session_factory, max_attendees=10, number_of_users=40)
+    session = session_factory()
+    session.add_all(
+        [WaitlistEntry(masterclass_id=1, attendee_id=i) for i in range(1, 31)]
+    )
+    session.commit()
+    session.close()
+
+    promotions = [
+        lambda session: promote_from_waitlist(1, session=session) for _ in range(5)
+    ]
+    signups = [
+        lambda session, attendee_id=attendee_id: reserve_seat(
+            1, attendee_id, session=session
+        )
+        for attendee_id in range(31, 41)
+    ]
+    outcomes = _run_concurrently(session_factory, promotions + signups)
+
+    promoted = sum(outcomes[:5])
+    assert promoted + outcomes[5:].count(BookingOutcome.BOOKED) == 10
+    assert _booked_count_and_attendees(session_factory) == (10, 10)
+    session = session_factory()
+    assert session.query(WaitlistEntry).count() == 30 - promoted
+    session.close()
+
+
+@pytest.mark.parametrize("attempt", range(5))
+def test_concurrent_cancellations_and_signups_stay_consistent(session_factory, attempt):
+    """
+    Tests that with every place taken, each booked user cancelling twice at
+    the same moment as new users sign up frees each place exactly once, and
+    that the places freed are never oversold.
+    """
+    _set_up_masterclass(session_factory, max_attendees=10, number_of_users=30)
+    _sign_up_concurrently(session_factory, range(1, 11))
+
+    cancellations = [
+        lambda session, attendee_id=attendee_id: cancel_booking(
+            1, attendee_id, session=session
+        )
+        for attendee_id in list(range(1, 11)) * 2
+    ]
+    signups = [
+        lambda session, attendee_id=attendee_id: reserve_seat(
+            1, attendee_id, session=session
+        )
+        for attendee_id in range(11, 31)
+    ]
+    outcomes = _run_concurrently(session_factory, cancellations + signups)
+
+    assert outcomes[:20].count(BookingOutcome.CANCELLED) == 10
+    assert outcomes[:20].count(BookingOutcome.NOT_BOOKED) == 10
+    booked = outcomes[20:].count(BookingOutcome.BOOKED)
+    assert booked <= 10
+    assert _booked_count_and_attendees(session_factory) == (booked, booked)
@@ -1,9 +1,13 @@
+import json
+
 import pytest
 
 from flask import session, template_rendered, url_for
+from werkzeug.http import http_date
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from app.instrumentation import QueryBudgetExceeded
 from app.models import Location, Masterclass, MasterclassContent
 
 
@@ -145,6 +149,37 @@ def test_remote_joining_info_visible_in_masterclass_profile_if_user_is_attendee(
     response = logged_in_user.get('/masterclass/2')
     assert '<h2 class="govuk-heading-m">Joining link</h2>' in response.get_data(as_text=True)
 
+def test_masterclass_profile_takes_one_query(logged_in_user, test_masterclass_with_details, test_content_data_category, test_location, blank_session, count_queries):
+    logged_in_user.get('/masterclass/1')
+    with count_queries() as statements:
+        response = logged_in_user.get('/masterclass/1')
+    assert response.status_code == 200
+    assert len([s for s in statements if 'server_session' not in s]) == 1
+
+def test_join_waitlist_for_a_full_masterclass(logged_in_user, db, test_masterclass_with_details, test_content_data_category, test_location, blank_session):
+    test_masterclass_with_details.max_attendees = 0
+    db.session.commit()
+    assert 'Join the waitlist' in logged_in_user.get('/masterclass/1').get_data(as_text=True)
+
+    response = logged_in_user.post('/masterclass/1/waitlist')
+    assert response.status_code == 302
+    page = logged_in_user.get('/masterclass/1').get_data(as_text=True)
+    assert "You're number 1 on the waitlist" in page
+    assert 'Join the waitlist' not in page
+
+def test_cancel_booking(logged_in_user, test_masterclass_with_details, test_content_data_category, test_location, blank_session):
+    logged_in_user.post('/masterclass/1')
+    assert 'Cancel booking' in logged_in_user.get('/masterclass/1').get_data(as_text=True)
+
+    # A double submit is harmless
+    logged_in_user.post('/masterclass/1/cancel')
+    response = logged_in_user.post('/masterclass/1/cancel')
+
+    assert response.status_code == 302
+    page = logged_in_user.get('/masterclass/1').get_data(as_text=True)
+    assert "You're already attending this masterclass" not in page
+    assert test_masterclass_with_details.booked_count == 0
+
 def test_display_my_masterclasses_with_none_booked(logged_in_user, blank_session):
     response = logged_in_user.get('/my-masterclasses')
     assert '<p class="govuk-body">You haven\'t booked any masterclasses.</p>' in response.get_data(as_text=True)
@@ -154,6 +189,64 @@ def test_display_my_masterclasses(logged_in_user, test_masterclass_with_details,
     response = logged_in_user.get('/my-masterclasses')
     assert f'<a class="govuk-link--no-visited-state" href="/masterclass/1">{test_masterclass_with_details.content.name}</a>' in response.get_data(as_text=True)
 
+def test_my_masterclasses_calendar_feed(logged_in_user, test_user, test_masterclass_with_details, test_content_data_category, test_location, blank_session):
+    logged_in_user.post('/masterclass/1')
+    logged_in_user.post('/calendar')
+    feed_url = f'/calendar/{test_user.calendar_token}/my-masterclasses.ics'
+
+    response = logged_in_user.get(feed_url)
+    feed = response.get_data(as_text=True)
+    assert response.mimetype == 'text/calendar'
+    assert 'SUMMARY:Introduction to R\r\n' in feed
+    assert 'DTSTART:20201030T153000\r\n' in feed
+    assert 'LOCATION:Test building\\, 1 Road\\, SW1 1RE\r\n' in feed
+    etag, is_weak = response.get_etag()
+    assert not is_weak
+
+    assert logged_in_user.get(feed_url, headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+
+    logged_in_user.post('/masterclass/1/cancel')
+    response = logged_in_user.get(feed_url, headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert 'BEGIN:VEVENT' not in response.get_data(as_text=True)
+
+def test_catalogue_calendar_feed_is_cached_until_a_masterclass_changes(logged_in_user, db, test_user, test_masterclass_with_details, test_content_data_category, test_location, blank_session, count_queries):
+    test_masterclass_with_details.draft = False
+    test_masterclass_with_details.timestamp = datetime.now() + timedelta(days=7)
+    db.session.commit()
+    logged_in_user.post('/calendar')
+    feed_url = f'/calendar/{test_user.calendar_token}/catalogue.ics'
+    first = logged_in_user.get(feed_url).get_data()
+
+    with count_queries() as statements:
+        second = logged_in_user.get(feed_url).get_data()
+    assert second == first
+    # Only the token and the catalogue's version are looked up
+    assert len([s for s in statements if 'server_session' not in s]) == 2
+
+    test_content_data_category.name = 'Advanced R'
+    db.session.commit()
+    assert 'SUMMARY:Advanced R' in logged_in_user.get(feed_url).get_data(as_text=True)
+
+
+def test_viewing_the_calendar_page_creates_no_addresses(logged_in_user, test_user, blank_session):
+    response = logged_in_user.get('/calendar')
+    assert response.status_code == 200
+    assert 'Get calendar addresses' in response.get_data(as_text=True)
+    assert test_user.calendar_token is None
+
+
+def test_new_calendar_addresses_retire_the_old_ones(logged_in_user, test_user, blank_session):
+    logged_in_user.post('/calendar')
+    old_token = test_user.calendar_token
+
+    response = logged_in_user.post('/calendar')
+
+    assert response.status_code == 302
+    assert test_user.calendar_token != old_token
+    assert logged_in_user.get(f'/calendar/{old_token}/my-masterclasses.ics').status_code == 404
+    assert logged_in_user.get(f'/calendar/{test_user.calendar_token}/my-masterclasses.ics').status_code == 200
+
 # Add location tests
 
 
@@ -284,3 +377,212 @@ def test_handle_empty_location_fields(
     assert context["validation_error"]
     if empty_fields:
         assert context["empty_fields"] == empty_fields
+
+
+def test_signing_up_increments_booked_count(logged_in_user, test_masterclass, blank_session):
+    test_masterclass.max_attendees = 10
+    blank_session.commit()
+    logged_in_user.post(f'/masterclass/{test_masterclass.id}')
+    assert test_masterclass.booked_count == 1
+    assert test_masterclass.remaining_spaces() == 9
+
+
+def test_signing_up_to_a_full_masterclass(logged_in_user, test_masterclass_remote, blank_session):
+    test_masterclass_remote.max_attendees = 0
+    blank_session.commit()
+    response = logged_in_user.post('/masterclass/2')
+    assert response.status_code == 302
+    assert response.location == f'http://localhost{url_for("main_bp.masterclass_profile", masterclass_id=2)}'
+    assert 'This masterclass is full' in logged_in_user.get('/masterclass/2').get_data(as_text=True)
+
+
+def test_location_search_falls_back_to_google_maps(logged_in_user, fake_gmaps):
+    response = logged_in_user.post(
+        "/create-masterclass/location/search",
+        data={"location": "A place"},
+        follow_redirects=True,
+    )
+    assert fake_gmaps.queries == ["A place"]
+    assert "An address" in response.get_data(as_text=True)
+
+
+def test_repeated_location_searches_are_served_from_cache(logged_in_user, fake_gmaps):
+    from app.places import places
+
+    for query in ("102 Petty France", "102, petty  FRANCE", "102 Petty France"):
+        logged_in_user.post("/create-masterclass/location/search", data={"location": query})
+    assert fake_gmaps.queries == ["102 Petty France"]
+
+    # A new process has an empty in-memory cache but shares the database
+    places.cache.clear()
+    logged_in_user.post("/create-masterclass/location/search", data={"location": "102 petty france"})
+    assert fake_gmaps.queries == ["102 Petty France"]
+    assert places.stats == {"miss": 1, "memory_hit": 2, "database_hit": 1}
+
+
+def test_location_search_shows_saved_locations_when_google_maps_is_down(
+    logged_in_user, fake_maps_server, test_location
+):
+    fake_maps_server.status = "UNKNOWN_ERROR"
+    response = logged_in_user.post(
+        "/create-masterclass/location/search",
+        data={"location": "Road building"},
+        follow_redirects=True,
+    )
+    page = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert "We can't search Google Maps at the moment" in page
+    assert "Test building" in page
+
+
+def test_location_search_shows_saved_locations_when_google_maps_misbehaves(
+    logged_in_user, fake_maps_server, test_location, monkeypatch
+):
+    from app.places import places
+
+    def malformed(query):
+        raise ValueError("Malformed response")
+
+    monkeypatch.setattr(places.client, "places", malformed)
+    response = logged_in_user.post(
+        "/create-masterclass/location/search",
+        data={"location": "Road building"},
+        follow_redirects=True,
+    )
+    page = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert "We can't search Google Maps at the moment" in page
+    assert "Test building" in page
+
+
+def test_session_cookie_only_carries_an_id(logged_in_user, fake_gmaps):
+    from app.models import ServerSession
+
+    logged_in_user.post("/create-masterclass/location/search", data={"location": "A place"})
+    cookie = next(c for c in logged_in_user.cookie_jar if c.name == "session")
+    stored = ServerSession.query.get(cookie.value)
+    assert "An address" not in cookie.value
+    assert "An address" in stored.data
+
+
+def test_logging_in_issues_a_new_session_id(test_client, db, test_user, fake_gmaps):
+    from app.models import ServerSession
+
+    with test_client:
+        test_client.post("/create-masterclass/location/search", data={"location": "A place"})
+        before = next(c for c in test_client.cookie_jar if c.name == "session").value
+        assert ServerSession.query.get(before) is not None
+        test_client.post(
+            url_for("main_bp.login"),
+            data={"email-address": "test@example.com", "password": "password"}
+        )
+        after = next(c for c in test_client.cookie_jar if c.name == "session").value
+        test_client.get(url_for("main_bp.logout"))
+
+    assert after != before
+    assert ServerSession.query.get(before) is None
+    assert ServerSession.query.get(after) is not None
+
+
+def test_catalogue_pages_through_upcoming_masterclasses_only(
+    test_app, logged_in_user, blank_session, monkeypatch
+):
+    monkeypatch.setitem(test_app.config, "CATALOGUE_PAGE_SIZE", 2)
+    next_week = datetime.now() + timedelta(days=7)
+    blank_session.add_all(
+        [
+            Masterclass(id=1, draft=False, timestamp=next_week + timedelta(days=2)),
+            Masterclass(id=2, draft=False, timestamp=next_week),
+            Masterclass(id=3, draft=False, timestamp=next_week),
+            Masterclass(id=4, draft=False, timestamp=next_week + timedelta(days=1)),
+            Masterclass(id=5, draft=False, timestamp=datetime(2020, 1, 1)),
+            Masterclass(id=6, draft=True, timestamp=next_week),
+        ]
+    )
+    blank_session.commit()
+
+    pages = []
+    with captured_templates(test_app) as templates:
+        url = '/'
+        while url:
+            logged_in_user.get(url)
+            context = templates[-1][1]
+            pages.append([masterclass.id for masterclass in context["masterclasses"]])
+            url = context["next_cursor"] and url_for("main_bp.index", after=context["next_cursor"])
+
+    assert pages == [[2, 3], [4, 1]]
+
+
+def test_catalogue_rejects_malformed_cursor(logged_in_user):
+    assert logged_in_user.get('/?after=yesterday').status_code == 400
+
+
+@pytest.mark.parametrize('route', ('/', '/masterclass/2', '/my-masterclasses'))
+def test_unchanged_pages_are_not_rendered_again(test_app, logged_in_user, test_masterclass_remote, route):
+    etag = logged_in_user.get(route).headers['ETag']
+    with captured_templates(test_app) as templates:
+        response = logged_in_user.get(route, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert templates == []
+
+
+@pytest.mark.parametrize('route', ('/', '/masterclass/2', '/my-masterclasses'))
+def test_pages_are_rendered_again_after_signing_up(logged_in_user, test_masterclass_remote, blank_session, route):
+    test_masterclass_remote.draft = False
+    test_masterclass_remote.timestamp = datetime.now() + timedelta(days=1)
+    blank_session.commit()
+    etag = logged_in_user.get(route).headers['ETag']
+    logged_in_user.post('/masterclass/2')
+    response = logged_in_user.get(route, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_masterclass_profile_is_rendered_again_after_its_description_changes(logged_in_user, test_masterclass_remote, blank_session):
+    test_masterclass_remote.content = MasterclassContent(name='Python', description='Old')
+    blank_session.commit()
+    etag = logged_in_user.get('/masterclass/2').headers['ETag']
+    test_masterclass_remote.content.description = 'New'
+    blank_session.commit()
+    response = logged_in_user.get('/masterclass/2', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'New' in response.get_data(as_text=True)
+
+
+def test_masterclass_profile_is_only_revalidated_by_etag(logged_in_user, test_masterclass_remote):
+    response = logged_in_user.get('/masterclass/2')
+    assert 'Last-Modified' not in response.headers
+    response = logged_in_user.get('/masterclass/2', headers={'If-Modified-Since': http_date(datetime.utcnow() + timedelta(days=1))})
+    assert response.status_code == 200
+
+
+def test_missing_masterclass_profile_is_not_found(logged_in_user):
+    assert logged_in_user.get('/masterclass/99').status_code == 404
+
+
+def test_sql_timing_reported_per_request(logged_in_user, test_masterclass_remote, blank_session, caplog):
+    with caplog.at_level('INFO', logger='app.instrumentation'):
+        response = logged_in_user.get('/masterclass/2')
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    logged = json.loads(caplog.records[-1].getMessage())
+    assert logged['endpoint'] == 'main_bp.masterclass_profile'
+    assert logged['queries'] >= 1
+    assert len(logged['slowest']) <= 3
+    assert any(slow['statement'].startswith('SELECT masterclass.id') for slow in logged['slowest'])
+
+
+def test_requests_over_the_query_budget_fail(test_app, logged_in_user, test_masterclass_remote, blank_session, monkeypatch):
+    monkeypatch.setitem(test_app.config, 'SQL_QUERY_BUDGET', 0)
+    with pytest.raises(QueryBudgetExceeded):
+        logged_in_user.get('/masterclass/2')
+
+
+def test_metrics_endpoint_reports_requests(test_client, logged_in_user, blank_session):
+    logged_in_user.get('/my-masterclasses')
+    response = test_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    body = response.get_data(as_text=True)
+    assert 'masterclasses_http_requests_total{endpoint="main_bp.my_masterclasses",method="GET",status="200"}' in body
+    assert 'masterclasses_http_request_duration_seconds_bucket{endpoint="main_bp.my_masterclasses"' in body
+    assert 'masterclasses_db_pool_checkouts_total' in body
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+import pytest
+
+from app import create_app
+from app import db as _db
+from app.models import Masterclass, MasterclassContent, User
+from config import TestConfig
+
+
+def _seed(engine, content_name):
+    engine.execute(
+        User.__table__.insert(),
+        id=1,
+        email="test@example.com",
+        password_hash=generate_password_hash("password"),
+    )
+    engine.execute(MasterclassContent.__table__.insert(), id=1, name=content_name)
+    engine.execute(
+        Masterclass.__table__.insert(),
+        id=1,
+        draft=False,
+        max_attendees=10,
+        timestamp=datetime(2030, 1, 1, 9),
+        masterclass_content_id=1,
+        instructor_id=1,
+    )
+
+
+@pytest.fixture
+def replica_client(tmp_path, monkeypatch):
+    """
+    Returns a function which creates an app with separate primary and replica
+    SQLite databases, each holding the same masterclass under a different
+    name, and returns a client logged in to it.
+    """
+
+    def _replica_client(pin_seconds=5):
+        class ReplicaConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(tmp_path / "primary.db")
+            REPLICA_DATABASE_URL = "sqlite:///" + str(tmp_path / "replica.db")
+            REPLICA_PIN_SECONDS = pin_seconds
+
+        app = create_app(ReplicaConfig)
+        # Other tests leave db.session bound to their rolled back connection
+        monkeypatch.setattr(_db, "session", _db.create_scoped_session())
+        with app.app_context():
+            _db.create_all()
+            _db.metadata.create_all(bind=_db.replica_engine())
+            _seed(_db.get_engine(), "Primary copy")
+            _seed(_db.replica_engine(), "Replica copy")
+
+        client = app.test_client()
+        client.post(
+            "/login", data={"email-address": "test@example.com", "password": "password"}
+        )
+        return client
+
+    return _replica_client
+
+
+def test_read_only_views_read_from_the_replica(replica_client):
+    client = replica_client()
+    assert "Replica copy" in client.get("/").get_data(as_text=True)
+    assert "Replica copy" in client.get("/masterclass/1").get_data(as_text=True)
+
+
+def test_writes_go_to_the_primary_and_pin_reads_to_it(replica_client):
+    client = replica_client()
+
+    client.post("/masterclass/1")
+    page = client.get("/my-masterclasses").get_data(as_text=True)
+
+    assert "Primary copy" in page
+
+
+def test_reads_return_to_the_replica_once_the_pin_expires(replica_client):
+    client = replica_client(pin_seconds=0)
+
+    client.post("/masterclass/1")
+    page = client.get("/my-masterclasses").get_data(as_text=True)
+
+    # The booking hasn't been copied to this replica, and never will be
+    assert "You haven't booked any masterclasses." in page
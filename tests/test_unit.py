@@ -1,4 +1,45 @@
-from app.models import Masterclass, MasterclassAttendee, User
+from datetime import datetime, timedelta
+import logging
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import app.models
+from app.bookings import (
+    BookingOutcome,
+    cancel_booking,
+    change_capacity,
+    join_waitlist,
+    reserve_seat,
+)
+from app.cache import LRUCache
+from app.calendars import escape_text, fold, to_ical
+from app.circuit_breaker import CircuitBreaker
+from app.fragments import masterclass_cards
+from app.jobs import job_queue
+from app.mail import FileSink, mailer
+from app.models import (
+    Job,
+    Location,
+    Masterclass,
+    MasterclassAttendee,
+    MasterclassContent,
+    PlaceSearch,
+    User,
+    WaitlistEntry,
+)
+from app.notifications import BOOKING_CONFIRMATION, MASTERCLASS_REMINDER
+from app.places import PlacesUnavailable, places
+from app.serving import reinitialise_after_fork
+from app.sessions import DatabaseSessionStore, MemorySessionStore
+from app.users import user_cache
+from config import TestConfig
+
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client.multiprocess import MultiProcessCollector
+import sqlalchemy
 
 import pytest
 
@@ -49,3 +90,904 @@ def test_empty_optional_fields_set_as_none(
     method = getattr(test_masterclass, method)
     method(data)
     assert getattr(test_masterclass, optional_field) is None
+
+
+def _add_published_masterclasses(db, start, stop):
+    """
+    Bulk inserts published masterclasses with their own content, location
+    and instructor, so that nothing is served from the session identity map.
+    """
+    ids = range(start, stop)
+    db.session.bulk_insert_mappings(
+        User, [{"id": i, "email": f"instructor{i}@example.com"} for i in ids]
+    )
+    db.session.bulk_insert_mappings(
+        MasterclassContent, [{"id": i, "name": f"Masterclass {i}"} for i in ids]
+    )
+    db.session.bulk_insert_mappings(
+        Location, [{"id": i, "name": f"Building {i}"} for i in ids]
+    )
+    db.session.bulk_insert_mappings(
+        Masterclass,
+        [
+            {
+                "id": i,
+                "draft": False,
+                "max_attendees": 10,
+                "timestamp": datetime(2030, 1, 1) + timedelta(hours=i),
+                "masterclass_content_id": i,
+                "location_id": i,
+                "instructor_id": i,
+            }
+            for i in ids
+        ],
+    )
+    db.session.commit()
+
+
+def _render_catalogue(masterclasses):
+    return [
+        (mc.content.name, mc.location.name, mc.instructor.email)
+        for mc in masterclasses
+    ]
+
+
+def test_upcoming_catalogue_query_count_is_constant(db, blank_session, count_queries):
+    """
+    Tests that loading the catalogue and touching each masterclass's content,
+    location and instructor takes the same number of queries for 10 rows as
+    for 10,000.
+    """
+    _add_published_masterclasses(db, 1, 11)
+    db.session.expire_all()
+    with count_queries() as small_catalogue_queries:
+        assert len(_render_catalogue(Masterclass.upcoming_catalogue())) == 10
+
+    _add_published_masterclasses(db, 11, 10001)
+    db.session.expire_all()
+    with count_queries() as large_catalogue_queries:
+        assert len(_render_catalogue(Masterclass.upcoming_catalogue())) == 10000
+
+    assert len(small_catalogue_queries) == len(large_catalogue_queries) == 1
+
+
+def test_booked_masterclasses_split_in_one_query(db, blank_session, count_queries):
+    _add_published_masterclasses(db, 1, 201)
+    db.session.bulk_update_mappings(
+        Masterclass,
+        [
+            {"id": i, "timestamp": datetime(2010, 1, 1) + timedelta(hours=i)}
+            for i in range(1, 51)
+        ],
+    )
+    db.session.bulk_insert_mappings(
+        MasterclassAttendee,
+        [{"attendee_id": 1, "masterclass_id": i} for i in range(1, 201)],
+    )
+    db.session.commit()
+    user = User.query.get(1)
+
+    with count_queries() as statements:
+        booked = user.get_upcoming_and_past_masterclasses()
+        _render_catalogue(booked.upcoming + booked.past)
+
+    assert len(statements) == 1
+    assert [mc.id for mc in booked.upcoming] == list(range(51, 201))
+    assert [mc.id for mc in booked.past] == list(range(50, 0, -1))
+
+
+def _query_plans(db, count_queries, run) -> str:
+    """
+    Calls run with db, then returns SQLite's query plan for every statement it
+    executed, one step per line.
+    """
+    with count_queries(with_parameters=True) as executed:
+        run(db)
+
+    cursor = db.session.connection().connection.cursor()
+    steps = []
+    for statement, parameters in executed:
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        steps.extend(row[3] for row in cursor.fetchall())
+    return "\n".join(steps)
+
+
+def _rename_location(db):
+    location = Location.query.get(1)
+    location.name = "Renamed building"
+    db.session.commit()
+
+
+@pytest.mark.skipif(
+    not TestConfig.SQLALCHEMY_DATABASE_URI.startswith("sqlite"),
+    reason="checks SQLite's EXPLAIN QUERY PLAN output",
+)
+@pytest.mark.parametrize(
+    "run, index",
+    (
+        (
+            lambda db: Masterclass.upcoming_catalogue(limit=20),
+            "ix_masterclass_draft_timestamp_id (draft=? AND timestamp>?)",
+        ),
+        (
+            lambda db: User.query.get(1).get_booked_masterclasses(),
+            "sqlite_autoindex_masterclass_attendee_1 (attendee_id=?)",
+        ),
+        (
+            lambda db: Masterclass.get_profile(1, 1),
+            "sqlite_autoindex_masterclass_attendee_1 (attendee_id=? AND masterclass_id=?)",
+        ),
+        (
+            lambda db: MasterclassContent.query.filter_by(category="Data").all(),
+            "ix_masterclass_content_category (category=?)",
+        ),
+        (
+            lambda db: Masterclass.reconcile_booked_counts(),
+            "ix_masterclass_attendee_masterclass_id (masterclass_id=?)",
+        ),
+        (_rename_location, "ix_masterclass_location_id (location_id=?)"),
+    ),
+)
+def test_hot_queries_use_their_indexes(db, blank_session, count_queries, run, index):
+    _add_published_masterclasses(db, 1, 3)
+    assert index in _query_plans(db, count_queries, run)
+
+
+def test_booked_count_maintained_on_signup_and_cancellation(
+    db, blank_session, test_masterclass, test_user
+):
+    test_masterclass.max_attendees = 10
+    db.session.commit()
+    assert reserve_seat(test_masterclass.id, test_user.id) is BookingOutcome.BOOKED
+    assert test_masterclass.booked_count == 1
+    assert test_masterclass.remaining_spaces() == 9
+
+    assert cancel_booking(test_masterclass.id, test_user.id) is BookingOutcome.CANCELLED
+    assert test_masterclass.booked_count == 0
+    assert test_masterclass.remaining_spaces() == 10
+
+
+def test_cancelling_a_missing_booking_leaves_booked_count_alone(
+    db, blank_session, test_masterclass, test_user
+):
+    assert (
+        cancel_booking(test_masterclass.id, test_user.id) is BookingOutcome.NOT_BOOKED
+    )
+    assert test_masterclass.booked_count == 0
+
+
+def test_locking_a_masterclass_leaves_updated_at_alone(
+    db, blank_session, test_masterclass, test_user
+):
+    updated_at = test_masterclass.updated_at
+    assert cancel_booking(test_masterclass.id, test_user.id) is BookingOutcome.NOT_BOOKED
+    db.session.expire_all()
+    assert Masterclass.query.get(test_masterclass.id).updated_at == updated_at
+
+
+def test_reconcile_booked_counts_command(
+    test_app, db, blank_session, test_masterclass, test_user
+):
+    """Tests drifted counts are repaired and correct ones are left alone."""
+    other = Masterclass(id=2, booked_count=0)
+    db.session.add(other)
+    db.session.add(
+        MasterclassAttendee(attendee_id=test_user.id, masterclass_id=test_masterclass.id)
+    )
+    db.session.commit()
+
+    result = test_app.test_cli_runner().invoke(args=["reconcile-booked-counts"])
+
+    assert "Repaired booked count for 1 masterclass(es)." in result.output
+    assert Masterclass.query.get(1).booked_count == 1
+    assert Masterclass.query.get(2).booked_count == 0
+
+
+def test_reserve_seat_when_already_booked(
+    db, blank_session, test_masterclass, test_user
+):
+    test_masterclass.max_attendees = 10
+    db.session.commit()
+    reserve_seat(test_masterclass.id, test_user.id)
+    assert (
+        reserve_seat(test_masterclass.id, test_user.id)
+        is BookingOutcome.ALREADY_BOOKED
+    )
+    assert test_masterclass.booked_count == 1
+
+
+def test_reserve_seat_when_full(db, blank_session, test_masterclass, test_user):
+    test_masterclass.max_attendees = 0
+    db.session.commit()
+    assert reserve_seat(test_masterclass.id, test_user.id) is BookingOutcome.FULL
+    assert test_masterclass.booked_count == 0
+    assert not MasterclassAttendee.is_attendee(test_user.id, test_masterclass.id)
+
+
+def _fill_waitlist(db, masterclass_id, attendee_ids):
+    db.session.bulk_insert_mappings(
+        User, [{"id": i, "email": f"waiter{i}@example.com"} for i in attendee_ids]
+    )
+    db.session.bulk_insert_mappings(
+        WaitlistEntry,
+        [{"masterclass_id": masterclass_id, "attendee_id": i} for i in attendee_ids],
+    )
+    db.session.commit()
+
+
+def _waitlist_position(db, attendee_id, masterclass_id):
+    return db.session.query(
+        WaitlistEntry.position_of(attendee_id, masterclass_id)
+    ).scalar()
+
+
+def test_join_waitlist_when_full(db, blank_session, test_masterclass, test_user):
+    test_masterclass.max_attendees = 0
+    db.session.commit()
+
+    assert join_waitlist(test_masterclass.id, test_user.id) is BookingOutcome.WAITLISTED
+    assert (
+        join_waitlist(test_masterclass.id, test_user.id)
+        is BookingOutcome.ALREADY_WAITLISTED
+    )
+    assert _waitlist_position(db, test_user.id, test_masterclass.id) == 1
+    assert _waitlist_position(db, 999, test_masterclass.id) == 0
+
+
+def test_join_waitlist_books_straight_away_when_there_is_a_place(
+    db, blank_session, test_masterclass, test_user
+):
+    test_masterclass.max_attendees = 1
+    db.session.commit()
+
+    assert join_waitlist(test_masterclass.id, test_user.id) is BookingOutcome.BOOKED
+    assert MasterclassAttendee.is_attendee(test_user.id, test_masterclass.id)
+    assert WaitlistEntry.query.count() == 0
+
+
+def test_waitlist_promotion_is_fifo_and_takes_constant_queries(
+    db, blank_session, test_masterclass, count_queries
+):
+    """
+    Tests that raising capacity books the longest waiting users, in the
+    order they joined rather than by user id, in the same number of
+    statements whether it promotes one user or thousands.
+    """
+    test_masterclass.max_attendees = 0
+    db.session.commit()
+    waiters = list(range(5000, 2000, -1))
+    _fill_waitlist(db, test_masterclass.id, waiters)
+
+    with count_queries() as one_promotion:
+        assert change_capacity(test_masterclass.id, 1) == 1
+    with count_queries() as many_promotions:
+        assert change_capacity(test_masterclass.id, 2001) == 2000
+
+    assert len(one_promotion) == len(many_promotions)
+    booked = {
+        attendee_id
+        for attendee_id, in db.session.query(MasterclassAttendee.attendee_id)
+    }
+    assert booked == set(waiters[:2001])
+    assert Masterclass.query.get(test_masterclass.id).booked_count == 2001
+    assert WaitlistEntry.query.count() == 999
+    assert _waitlist_position(db, waiters[2001], test_masterclass.id) == 1
+    assert _waitlist_position(db, waiters[-1], test_masterclass.id) == 999
+
+
+@pytest.mark.skipif(
+    not TestConfig.SQLALCHEMY_DATABASE_URI.startswith("sqlite")
+    or not hasattr(sqlite3.Connection, "setlimit"),
+    reason="lowers SQLite's bound variable limit, which needs Python 3.11",
+)
+def test_waitlist_promotion_fits_old_sqlite_variable_limit(
+    db, blank_session, test_masterclass
+):
+    """
+    Tests that promoting more waiters than SQLite before 3.32 allowed bound
+    variables in one statement works, by lowering the limit to its old 999.
+    """
+    test_masterclass.max_attendees = 0
+    db.session.commit()
+    _fill_waitlist(db, test_masterclass.id, range(2000, 3500))
+
+    connection = db.session.connection().connection
+    old_limit = connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    try:
+        assert change_capacity(test_masterclass.id, 1500) == 1500
+    finally:
+        connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, old_limit)
+
+    assert WaitlistEntry.query.count() == 0
+
+
+def test_promotion_only_confirms_waiters_it_books(db, blank_session, test_masterclass):
+    test_masterclass.max_attendees = 0
+    db.session.commit()
+    _fill_waitlist(db, test_masterclass.id, [100, 101])
+    db.session.add(MasterclassAttendee(attendee_id=100, masterclass_id=1))
+    db.session.commit()
+
+    assert change_capacity(test_masterclass.id, 3) == 1
+
+    assert [job.payload["attendee_id"] for job in Job.query] == [101]
+    assert WaitlistEntry.query.count() == 0
+
+
+def test_cancellation_gives_the_place_to_the_next_waiter(
+    db, blank_session, test_masterclass, test_user
+):
+    test_masterclass.max_attendees = 1
+    db.session.commit()
+    reserve_seat(test_masterclass.id, test_user.id)
+    _fill_waitlist(db, test_masterclass.id, [100, 101])
+
+    cancel_booking(test_masterclass.id, test_user.id)
+
+    assert MasterclassAttendee.is_attendee(100, test_masterclass.id)
+    assert test_masterclass.booked_count == 1
+    assert _waitlist_position(db, 101, test_masterclass.id) == 1
+
+
+def test_promote_waitlists_command(test_app, db, blank_session, test_masterclass):
+    test_masterclass.max_attendees = 0
+    db.session.commit()
+    _fill_waitlist(db, test_masterclass.id, range(100, 103))
+    db.session.query(Masterclass).update({Masterclass.max_attendees: 2})
+    db.session.commit()
+
+    result = test_app.test_cli_runner().invoke(args=["promote-waitlists"])
+
+    assert "Promoted 2 waiting user(s) on 1 masterclass(es)." in result.output
+    assert _waitlist_position(db, 102, 1) == 1
+
+
+def test_location_search_index_follows_updates(db, blank_session):
+    location = Location(name="Old Admiralty Building", address="Spring Gardens")
+    db.session.add(location)
+    db.session.commit()
+
+    location.name = "Windsor House"
+    db.session.commit()
+
+    assert Location.return_existing_location_or_none("Windsor") == [location]
+    assert Location.return_existing_location_or_none("Admiralty") == []
+
+
+def test_location_search_ranks_closest_match_first(db, blank_session):
+    db.session.add_all(
+        [
+            Location(id=1, name="Home Office", address="2 Marsham Street, London SW1P 4DF"),
+            Location(id=2, name="102 Petty France", address="London SW1H 9AJ"),
+        ]
+    )
+    db.session.commit()
+
+    results = Location.return_existing_location_or_none("London SW1H", limit=3)
+
+    assert [location.id for location in results] == [2]
+    assert [
+        location.id for location in Location.return_existing_location_or_none("London")
+    ] == [2, 1]
+
+
+def test_location_search_scans_without_the_trigram_tokenizer(
+    db, blank_session, monkeypatch
+):
+    monkeypatch.setattr(db.engine.dialect.dbapi, "sqlite_version_info", (3, 31, 1))
+    engine = sqlalchemy.create_engine("sqlite://")
+    db.metadata.create_all(engine, tables=[Location.__table__])
+    assert "location_search" not in sqlalchemy.inspect(engine).get_table_names()
+
+    location = Location(name="Windsor House", address="42-50 Victoria Street")
+    db.session.add(location)
+    db.session.commit()
+
+    assert Location.return_existing_location_or_none("Windsor") == [location]
+
+
+def test_location_search_skips_ranking_common_terms(db, blank_session, monkeypatch):
+    monkeypatch.setattr(app.models, "COMMON_TERM_MATCHES", 2)
+    db.session.add_all(
+        [Location(id=id, name=f"Office {id}", address="London") for id in range(1, 4)]
+    )
+    db.session.commit()
+
+    results = Location.return_existing_location_or_none("London", limit=2)
+
+    assert len(results) == 2
+    assert Location.return_existing_location_or_none("Office 3") == [
+        Location.query.get(3)
+    ]
+
+
+def test_calendar_lines_are_escaped_and_folded_at_75_octets():
+    assert escape_text("Data, AI; and\\ more\nsoon") == (
+        "Data\\, AI\\; and\\\\ more\\nsoon"
+    )
+    line = "SUMMARY:" + "é" * 80
+    folded = fold(line).split("\r\n")
+    assert all(len(part.encode()) <= 75 for part in folded)
+    assert all(part.startswith(" ") for part in folded[1:])
+    assert folded[0] + "".join(part[1:] for part in folded[1:]) == line
+
+
+def test_calendar_event_for_a_masterclass_without_content_or_location(test_app):
+    masterclass = Masterclass(id=1, is_remote=False, timestamp=datetime(2030, 1, 1))
+
+    with test_app.test_request_context():
+        feed = to_ical("Masterclasses", [masterclass], "example.com").decode()
+
+    assert "SUMMARY:Masterclass\r\n" in feed
+    assert "LOCATION:\r\n" in feed
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_lru_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(ttl=60)
+    cache.set("a", 1)
+    now[0] += 61
+    assert cache.get("a") is None
+
+
+def test_named_lru_cache_counts_lookups_in_metrics():
+    cache = LRUCache(name="test")
+    labels = {"cache": "test", "result": "hit"}
+    hits = REGISTRY.get_sample_value("masterclasses_cache_lookups_total", labels) or 0
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    assert REGISTRY.get_sample_value("masterclasses_cache_lookups_total", labels) == (
+        hits + 1
+    )
+
+
+def test_request_sql_is_logged_without_logging_being_configured(test_app):
+    logger = logging.getLogger("app.instrumentation")
+    assert logger.handlers
+    assert logger.isEnabledFor(logging.INFO)
+
+
+def test_metrics_are_added_up_across_processes(tmp_path):
+    worker = (
+        "from app import create_app; from config import TestConfig; "
+        "create_app(TestConfig).test_client().get('/login')"
+    )
+    environment = dict(os.environ, prometheus_multiproc_dir=str(tmp_path))
+    for _ in range(2):
+        subprocess.run(
+            [sys.executable, "-c", worker],
+            env=environment,
+            cwd=os.path.dirname(os.path.dirname(__file__)),
+            check=True,
+        )
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=str(tmp_path))
+    labels = {"endpoint": "main_bp.login", "method": "GET", "status": "200"}
+    assert registry.get_sample_value("masterclasses_http_requests_total", labels) == 2
+
+
+def test_worker_gets_its_own_connections_and_maps_client(test_app, db, monkeypatch):
+    disposed = []
+    monkeypatch.setattr(
+        type(db.engine), "dispose", lambda engine: disposed.append(engine)
+    )
+    client = places.client
+
+    reinitialise_after_fork(test_app)
+
+    assert disposed == [db.engine]
+    assert places.client is not client
+
+
+def test_place_search_cache_expires_and_evicts(db, blank_session):
+    ttl = timedelta(days=1)
+    PlaceSearch.store_results("old", [], ttl, max_rows=2)
+    PlaceSearch.query.filter_by(normalised_query="old").update(
+        {"fetched_at": datetime.utcnow() - timedelta(days=2)}
+    )
+    assert PlaceSearch.get_fresh_results("old", ttl) is None
+
+    PlaceSearch.store_results("first", [{"name": "First"}], ttl, max_rows=2)
+    PlaceSearch.store_results("second", [], ttl, max_rows=2)
+    PlaceSearch.store_results("third", [], ttl, max_rows=2)
+
+    assert {search.normalised_query for search in PlaceSearch.query} == {
+        "second",
+        "third",
+    }
+
+
+def test_place_search_stored_by_another_request_is_overwritten(
+    db, blank_session, monkeypatch
+):
+    begin_nested = db.session.begin_nested
+
+    def store_first():
+        db.session.execute(
+            PlaceSearch.__table__.insert().values(
+                normalised_query="petty france",
+                results=[],
+                fetched_at=datetime.utcnow(),
+            )
+        )
+        return begin_nested()
+
+    monkeypatch.setattr(db.session, "begin_nested", store_first)
+    ttl = timedelta(days=1)
+    PlaceSearch.store_results("petty france", [{"name": "Ours"}], ttl, max_rows=2)
+
+    assert PlaceSearch.query.filter_by(normalised_query="petty france").count() == 1
+    assert PlaceSearch.get_fresh_results("petty france", ttl) == [{"name": "Ours"}]
+
+
+def test_slow_maps_api_is_abandoned_at_the_deadline(fake_maps_server):
+    fake_maps_server.delay = 2
+    start = time.monotonic()
+    with pytest.raises(PlacesUnavailable):
+        places.search("102 Petty France")
+    assert time.monotonic() - start < 1
+
+
+def test_circuit_breaker_stops_calls_after_repeated_failures(fake_maps_server):
+    fake_maps_server.status = "UNKNOWN_ERROR"
+    for query in ("first", "second", "third"):
+        with pytest.raises(PlacesUnavailable):
+            places.search(query)
+    assert fake_maps_server.requests == 2
+    assert places.breaker.state == CircuitBreaker.OPEN
+
+
+def test_circuit_breaker_counts_unexpected_errors(fake_maps_server, monkeypatch):
+    def malformed(query):
+        raise ValueError("Malformed response")
+
+    monkeypatch.setattr(places.client, "places", malformed)
+    for query in ("first", "second", "third"):
+        with pytest.raises(PlacesUnavailable):
+            places.search(query)
+    assert places.breaker.state == CircuitBreaker.OPEN
+
+
+def test_circuit_breaker_closes_after_successful_trial(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.circuit_breaker.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=30)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    now[0] += 30
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # only one trial at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.parametrize("store_class", (MemorySessionStore, DatabaseSessionStore))
+def test_session_stores_expire_and_sweep_sessions(db, blank_session, store_class):
+    store = store_class()
+    if store_class is DatabaseSessionStore:
+        store.bind = blank_session.bind
+    store.save("live", "{}", datetime.utcnow() + timedelta(hours=1))
+    store.save("expired", "{}", datetime.utcnow() - timedelta(seconds=1))
+
+    assert store.load("live")[0] == "{}"
+    assert store.load("expired") is None
+    assert store.sweep() == 1
+    assert store.sweep() == 0
+
+
+@pytest.mark.parametrize(
+    "change",
+    (
+        lambda mc: setattr(mc, "timestamp", datetime(2031, 1, 1)),
+        lambda mc: setattr(mc, "draft", True),
+        lambda mc: setattr(mc, "is_remote", True),
+        lambda mc: setattr(mc.content, "name", "Advanced R"),
+        lambda mc: setattr(mc.location, "address", "2 Road"),
+        lambda mc: setattr(mc.instructor, "first_name", "Ada"),
+        lambda mc: setattr(mc, "location", Location(name="Elsewhere")),
+    ),
+)
+def test_masterclass_version_bumped_when_card_changes(db, blank_session, change):
+    _add_published_masterclasses(db, 1, 2)
+    masterclass = Masterclass.query.get(1)
+
+    change(masterclass)
+    db.session.commit()
+
+    assert masterclass.version == 2
+
+
+def test_masterclass_version_kept_when_card_unchanged(
+    db, blank_session, test_masterclass, test_user
+):
+    test_masterclass.room = "1D"
+    test_masterclass.max_attendees = 10
+    db.session.commit()
+    reserve_seat(test_masterclass.id, test_user.id)
+    assert test_masterclass.version == 1
+
+
+def test_masterclass_cards_are_cached_by_version(db, blank_session):
+    _add_published_masterclasses(db, 1, 2)
+    masterclass = Masterclass.query.get(1)
+
+    first = masterclass_cards.render(masterclass)
+    assert masterclass_cards.render(masterclass) is first
+
+    masterclass.content.name = "Renamed masterclass"
+    db.session.commit()
+    assert "Renamed masterclass" in masterclass_cards.render(masterclass)
+
+
+def test_user_cache_loads_without_a_query_until_user_changes(
+    db, blank_session, test_user, count_queries
+):
+    user_cache.load(test_user.id)
+    db.session.expunge_all()
+    hits = user_cache.stats()["hits"]
+
+    with count_queries() as statements:
+        user = user_cache.load(test_user.id)
+        assert user.email == "test@example.com"
+        assert user.check_password("password")
+    assert statements == []
+    assert user in db.session
+
+    user.first_name = "Grace"
+    db.session.commit()
+    db.session.expunge_all()
+
+    with count_queries() as statements:
+        assert user_cache.load(test_user.id).first_name == "Grace"
+    assert len(statements) == 1
+    assert user_cache.stats()["hits"] == hits + 1
+
+
+def test_user_cache_forgets_deleted_users(db, blank_session, test_user):
+    user_id = test_user.id
+    user_cache.load(user_id)
+    db.session.delete(test_user)
+    db.session.commit()
+
+    assert user_cache.load(user_id) is None
+
+
+def test_user_cache_keeps_users_until_their_changes_are_committed(
+    db, blank_session, test_user
+):
+    user_cache.load(test_user.id)
+    test_user.first_name = "Grace"
+    db.session.flush()
+    assert user_cache.cache.get(test_user.id) is not None
+
+    db.session.commit()
+    assert user_cache.cache.get(test_user.id) is None
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    """Returns a directory the mailer writes emails to instead of sending them."""
+    monkeypatch.setattr(mailer, "sink", FileSink(tmp_path))
+    return tmp_path
+
+
+def _sent_subjects(outbox):
+    return sorted(
+        line.split(": ", 1)[1]
+        for path in outbox.glob("*.eml")
+        for line in path.read_text().splitlines()
+        if line.startswith("Subject: ")
+    )
+
+
+def test_signup_queues_a_confirmation_without_sending_it(db, blank_session, outbox):
+    _add_published_masterclasses(db, 1, 2)
+
+    assert reserve_seat(1, 1) is BookingOutcome.BOOKED
+
+    job = Job.query.one()
+    assert (job.kind, job.payload) == (
+        BOOKING_CONFIRMATION,
+        {"masterclass_id": 1, "attendee_id": 1},
+    )
+    assert _sent_subjects(outbox) == []
+
+
+def test_worker_sends_confirmation_and_schedules_reminder(db, blank_session, outbox):
+    _add_published_masterclasses(db, 1, 2)
+    reserve_seat(1, 1)
+
+    assert job_queue.run_batch() == 1
+
+    assert _sent_subjects(outbox) == ["You're booked on Masterclass 1"]
+    reminder = Job.query.one()
+    assert reminder.kind == MASTERCLASS_REMINDER
+    assert reminder.run_at == datetime(2029, 12, 31, 1)
+    assert job_queue.run_batch() == 0
+
+
+def test_reminder_is_scheduled_in_utc(db, blank_session, outbox, monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        _add_published_masterclasses(db, 1, 2)
+        reserve_seat(1, 1)
+        job_queue.run_batch()
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    # 01:00 in New York on 1 January is 06:00 UTC
+    assert Job.query.one().run_at == datetime(2029, 12, 31, 6)
+
+
+def test_booking_emails_skip_masterclasses_without_content(
+    db, blank_session, outbox, test_user
+):
+    db.session.add(Masterclass(id=1, max_attendees=1))
+    db.session.commit()
+    reserve_seat(1, test_user.id)
+
+    assert job_queue.run_batch() == 1
+
+    assert _sent_subjects(outbox) == []
+    assert Job.query.count() == 0
+
+
+def test_reminder_is_sent_only_while_the_booking_stands(db, blank_session, outbox):
+    _add_published_masterclasses(db, 1, 3)
+    reserve_seat(1, 1)
+    reserve_seat(2, 1)
+    cancel_booking(2, 1)
+    payloads = [{"masterclass_id": id, "attendee_id": 1} for id in (1, 2)]
+    job_queue.enqueue_many(MASTERCLASS_REMINDER, payloads)
+    Job.query.filter_by(kind=BOOKING_CONFIRMATION).delete()
+    db.session.commit()
+
+    assert job_queue.run_batch() == 2
+
+    assert _sent_subjects(outbox) == ["Reminder: Masterclass 1 is tomorrow"]
+    assert Job.query.count() == 0
+
+
+def test_failing_jobs_are_retried_with_backoff_then_given_up(
+    db, blank_session, monkeypatch
+):
+    def explode(user_id):
+        db.session.add(User(id=user_id, email="half-done@example.com"))
+        db.session.flush()
+        raise ConnectionRefusedError("SMTP server is down")
+
+    monkeypatch.setitem(job_queue.handlers, "explode", explode)
+    monkeypatch.setattr(job_queue, "max_attempts", 2)
+    job = job_queue.enqueue("explode", {"user_id": 99})
+    db.session.commit()
+
+    before = datetime.utcnow()
+    assert job_queue.run_batch() == 1
+    assert job.attempts == 1
+    assert job.failed_at is None
+    assert job.run_at >= before + timedelta(seconds=job_queue.retry_seconds)
+    assert "SMTP server is down" in job.last_error
+    assert User.query.get(99) is None
+    assert job_queue.run_batch() == 0
+
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+    assert job_queue.run_batch() == 1
+    assert job.attempts == 2
+    assert job.failed_at is not None
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+    assert job_queue.run_batch() == 0
+
+
+def test_claimed_jobs_are_only_claimed_again_once_their_lock_expires(
+    db, blank_session, monkeypatch
+):
+    monkeypatch.setattr(job_queue, "batch_size", 2)
+    job_queue.enqueue_many("noop", [{}, {}, {}])
+    db.session.commit()
+
+    first, second = job_queue.claim(), job_queue.claim()
+
+    assert (len(first), len(second)) == (2, 1)
+    assert first[0].locked_by != second[0].locked_by
+    assert job_queue.claim() == []
+
+    first[0].locked_at -= timedelta(seconds=job_queue.lock_timeout + 1)
+    db.session.commit()
+    assert [job.id for job in job_queue.claim()] == [first[0].id]
+
+
+def test_import_users_from_csv(test_app, db, blank_session, tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text(
+        "email,first_name,last_name\n"
+        "ada@example.com,Ada,Lovelace\n"
+        "alan@example.com,Alan,Turing\n"
+    )
+    runner = test_app.test_cli_runner()
+
+    result = runner.invoke(args=["import-data", "users", str(path), "--dry-run"])
+    assert "All 2 row(s) are valid." in result.output
+    assert User.query.count() == 0
+
+    result = runner.invoke(args=["import-data", "users", str(path), "--batch-size", "1"])
+    assert "Imported 2 row(s)" in result.output
+    assert {user.email for user in User.query} == {"ada@example.com", "alan@example.com"}
+
+
+def test_import_masterclasses_from_jsonl(test_app, db, blank_session, tmp_path, test_user):
+    db.session.add(MasterclassContent(id=1, name="Introduction to R"))
+    db.session.commit()
+    path = tmp_path / "masterclasses.jsonl"
+    path.write_text(
+        '{"timestamp": "2030-01-01T09:30", "max_attendees": 20, '
+        '"masterclass_content_id": 1, "instructor_email": "test@example.com"}\n'
+    )
+
+    test_app.test_cli_runner().invoke(args=["import-data", "masterclasses", str(path)])
+
+    masterclass = Masterclass.query.one()
+    assert masterclass.instructor.email == "test@example.com"
+    assert masterclass.timestamp == datetime(2030, 1, 1, 9, 30)
+    assert masterclass.booked_count == 0
+    assert masterclass.draft is False
+
+
+def test_import_reports_every_problem_and_writes_nothing(
+    test_app, db, blank_session, tmp_path, test_user
+):
+    path = tmp_path / "masterclasses.csv"
+    path.write_text(
+        "timestamp,max_attendees,masterclass_content_id,instructor_email\n"
+        "2030-01-01T09:30,twenty,1,test@example.com\n"
+        "2030-01-01T09:30,20,1,nobody@example.com\n"
+        "tomorrow,20,1,test@example.com\n"
+    )
+
+    result = test_app.test_cli_runner().invoke(
+        args=["import-data", "masterclasses", str(path)]
+    )
+
+    assert result.exit_code == 1
+    assert "line 2: max_attendees must be a whole number" in result.output
+    assert "line 3: no user with email nobody@example.com" in result.output
+    assert "line 4: timestamp must be an ISO 8601 date and time" in result.output
+    assert Masterclass.query.count() == 0
+
+
+def test_import_reports_malformed_json_lines(test_app, db, blank_session, tmp_path):
+    path = tmp_path / "users.jsonl"
+    path.write_text(
+        '{"email": "ada@example.com"}\n'
+        '{"email": "alan@example.com"\n'
+        '["grace@example.com"]\n'
+    )
+
+    result = test_app.test_cli_runner().invoke(args=["import-data", "users", str(path)])
+
+    assert result.exit_code == 1
+    assert "line 2: not valid JSON" in result.output
+    assert "line 3: not a JSON object" in result.output
+    assert User.query.count() == 0